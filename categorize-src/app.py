@@ -8,32 +8,160 @@ It provides a REST API to categorize the input documents.
 @version 1.0
 """
 
-import json, logging.config, os
-from flask import Flask, request, jsonify, abort
-from classifier import CrowdClassifier
+import cProfile, functools, json, logging, pstats, random, threading, time
+from StringIO import StringIO
+from flask import Flask, Response, request, jsonify, abort, stream_with_context
+from classifier import CLASSIFIER_SETTINGS, load_classifier, show_category, show_details, stem_cache_info
+from config import get_config, setup_logging
+from metrics import registry as metrics_registry
+from micro_batcher import MicroBatcher
+from model_registry import ModelRegistry
+from prediction_cache import PredictionCache
+from worker_pool import PredictionPool
 
 
 # setup logging
-with open('conf/logging.json', 'rt') as fd:
-    loggingConfig = json.load(fd)
-
-logging.config.dictConfig(loggingConfig)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # load configuration
-with open('conf/config.json', 'rt') as fd:
-    appConfig = json.load(fd)
+appConfig = get_config()
+
+
+# the metrics of the prediction stages, the sampled requests are profiled
+metricsConfig = appConfig['metrics']
+metrics_registry.enabled = metricsConfig['enabled']
 
 
 # the flask app
 app = Flask(__name__)
 
-# load the classifiers
-chile_classifier = CrowdClassifier(1, [1, 1, 0.5, 0.25, 0.25], 'spanish', 'log')
-chile_classifier.load(os.path.join(appConfig['trained_models_dir'], 'chile'))
+# the classifiers, they are loaded on first use or warmed in the background
+classifiers = {}
+load_states = dict((data_type, 'not_loaded') for data_type in CLASSIFIER_SETTINGS)
+# the lazy loads and the reloads of a data type share the lock, so an older model never replaces a newer one
+load_locks = dict((data_type, threading.Lock()) for data_type in CLASSIFIER_SETTINGS)
+preload_data_types = appConfig['preload_data_types']
+
+# the registry of the model versions
+model_registry = ModelRegistry(appConfig['trained_models_dir'])
+
+# the content predicted to warm up the reloaded classifier
+WARM_UP_CONTENT = u'warm up'
+
+# the cache of the predicted categories
+cacheConfig = appConfig['prediction_cache']
+prediction_cache = PredictionCache(cacheConfig['max_size'], cacheConfig['ttl'])
+
+# the worker processes to predict the large batches
+poolConfig = appConfig['prediction_pool']
+prediction_pool = None
+if poolConfig['processes'] > 0:
+    prediction_pool = PredictionPool(appConfig['trained_models_dir'], preload_data_types,
+                                     poolConfig['processes'], poolConfig['min_chunk_size'])
+
+
+def get_classifier(data_type):
+    """
+    Gets the classifier of the data type, it is loaded on the first call.
+    :param data_type: paloalto or chile
+    :return: the classifier
+    """
+    classifier = classifiers.get(data_type)
+    if classifier is None:
+        with load_locks[data_type]:
+            if data_type not in classifiers:
+                load_states[data_type] = 'loading'
+                logger.info('Load the %s classifier', data_type)
+                try:
+                    classifiers[data_type] = load_classifier(data_type, appConfig['trained_models_dir'])
+                except Exception:
+                    load_states[data_type] = 'failed'
+                    raise
+                load_states[data_type] = 'ready'
+            classifier = classifiers[data_type]
+    return classifier
+
+
+def warm_classifiers(data_types):
+    """
+    Loads the classifiers of the data types, it runs in the background when the app starts.
+    :param data_types: the data types to load
+    """
+    for data_type in data_types:
+        try:
+            get_classifier(data_type)
+        except Exception:
+            logger.exception('Fail to load the %s classifier', data_type)
+
+
+def reload_classifier(data_type, version=None):
+    """
+    Loads a model version of the data type, warms it up, and then swaps it in atomically.
+    The requests in flight keep using the classifier they already got.
+    :param data_type: paloalto or chile
+    :param version: the model version, None for the current version in the registry
+    :return: the classifier in use
+    """
+    model_name = CLASSIFIER_SETTINGS[data_type]['model_name']
+    with load_locks[data_type]:
+        if version is None:
+            version = model_registry.current_version(model_name)
+        classifier = classifiers.get(data_type)
+        if classifier is not None and classifier.version == version:
+            return classifier
 
-palo_alto_classifier = CrowdClassifier(5, [1, 1, 0.5, 0.25, 0.25], 'english', 'modified_huber')
-palo_alto_classifier.load(os.path.join(appConfig['trained_models_dir'], 'palo_alto'))
+        logger.info('Reload the %s classifier with the model version %s', data_type, version)
+        classifier = load_classifier(data_type, appConfig['trained_models_dir'], version=version)
+        # warm up the tokenizer and the memory-mapped weights before the swap
+        classifier.predict([WARM_UP_CONTENT])
+        classifiers[data_type] = classifier
+        load_states[data_type] = 'ready'
+        logger.info('The %s classifier is swapped to the model version %s', data_type, version)
+        return classifier
+
+
+def reload_in_background(data_type, version):
+    """
+    Reloads the classifier of the data type, it runs in a background thread.
+    :param data_type: paloalto or chile
+    :param version: the model version, None for the current version in the registry
+    """
+    try:
+        reload_classifier(data_type, version)
+    except Exception:
+        logger.exception('Fail to reload the %s classifier with the model version %s', data_type, version)
+
+
+def watch_models(interval):
+    """
+    Watches the current model versions in the registry, and reloads the loaded classifiers when they are changed.
+    :param interval: the interval in seconds to check the registry
+    """
+    while True:
+        time.sleep(interval)
+        for data_type, classifier in classifiers.items():
+            model_name = CLASSIFIER_SETTINGS[data_type]['model_name']
+            try:
+                version = model_registry.current_version(model_name)
+            except Exception:
+                logger.exception('Fail to check the current model version of %s', data_type)
+                continue
+            if version is not None and version != classifier.version:
+                reload_in_background(data_type, version)
+
+
+# warm the classifiers in the background, the worker processes are started before to not fork a loading thread
+warm_thread = threading.Thread(target=warm_classifiers, args=(preload_data_types,), name='warm-classifiers')
+warm_thread.daemon = True
+warm_thread.start()
+
+# watch the model registry to reload the new model versions
+if appConfig['model_watch_interval'] > 0:
+    watch_thread = threading.Thread(target=watch_models, args=(appConfig['model_watch_interval'],),
+                                    name='watch-models')
+    watch_thread.daemon = True
+    watch_thread.start()
 
 
 def get_value(doc, key):
@@ -53,51 +181,238 @@ def get_value(doc, key):
         return value[0]
 
 
-def show_category(categories):
+def predict_contents(data_type, contents):
     """
-    Converts the category names from array to readable name.
-    :param categories: the category arrays
-    :return: the category label
+    Predicts the contents with the cache, and with the worker processes if enabled.
+    :param data_type: paloalto or chile
+    :param contents: the contents to predict
+    :return: the predicted result (categories)
     """
-    names = ['main_category', 'subcategory1', 'subcategory2', 'subcategory3', 'subcategory4']
-    result = {}
-    prefixes = ['primary_', 'secondary_']
-    for i, category_items in enumerate(categories):
-        prefix = prefixes[i]
-        for idx, v in enumerate(category_items):
-            result[prefix + names[idx]] = v
+    classifier = get_classifier(data_type)
+    predict = classifier.predict
+    if prediction_pool:
+        predict = functools.partial(prediction_pool.predict, data_type, classifier)
+    return prediction_cache.predict(data_type, classifier, contents, predict)
+
 
+def profile_call(func, *args):
+    """
+    Profiles the function call, and logs the functions of the most cumulative time.
+    :param func: the function to call
+    :param args: the arguments of the function
+    :return: the result of the function
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args)
+    stream = StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(metricsConfig['profile_top'])
+    logger.info('The profile of the sampled request:\n%s', stream.getvalue())
     return result
 
 
-@app.route('/api/v1/categorize/<data_type>', methods=['POST'])
-def categorize(data_type):
+# the micro-batchers to coalesce the concurrent small requests
+microBatchingConfig = appConfig['micro_batching']
+micro_batchers = {}
+if microBatchingConfig['enabled']:
+    for name in CLASSIFIER_SETTINGS:
+        micro_batchers[name] = MicroBatcher(name, functools.partial(predict_contents, name),
+                                            microBatchingConfig['max_batch_size'],
+                                            microBatchingConfig['max_wait_ms'] / 1000.0)
+
+
+def categorize_documents(data_type, documents, top_k=0):
     """
-    The REST API to categorize the input documents
+    Categorizes the documents
     :param data_type: paloalto or chile
-    :return: categories of the documents
+    :param documents: the documents, each document has the id and the content
+    :param top_k: the number of the most probable categories of each level to return with the expected scores,
+    0 to return the categories only
+    :return: the categorized documents
     """
+    results = map(lambda x: {'id': x['id'], 'content': x['content']}, documents)
+    contents = map(lambda x: x['content'], documents)
+    metrics_registry.observe('crowd_batch_size', len(contents), data_type=data_type, source='request')
+    metrics_registry.inc('crowd_documents_total', len(contents), data_type=data_type)
 
-    data = request.get_json()
-
-    results = map(lambda x: {'id': x['id'], 'content': x['content']}, data['document'])
-    contents = map(lambda x: x['content'], data['document'])
+    # the details are computed by the classifier directly, they are not cached
+    if top_k > 0:
+        predicted = get_classifier(data_type).predict_details(contents, top_k)
+        for i in range(0, len(predicted)):
+            results[i].update(show_details(predicted[i]))
+        return results
 
     # predict the contents
-    predicted = None
-    if data_type == 'paloalto':
-        predicted = palo_alto_classifier.predict(contents)
-    elif data_type == 'chile':
-        predicted = chile_classifier.predict(contents)
+    if data_type in micro_batchers and len(contents) < micro_batchers[data_type].max_batch_size:
+        predicted = micro_batchers[data_type].predict(contents)
     else:
-        abort(404)
+        predicted = predict_contents(data_type, contents)
 
     for i in range(0, len(predicted)):
         results[i].update(show_category(predicted[i]))
+    return results
+
+
+@app.route('/api/v1/categorize/<data_type>', methods=['POST'])
+def categorize(data_type):
+    """
+    The REST API to categorize the input documents. The request body can have "top_k" to return the top k
+    categories of each level with their probabilities, and the expected scores of the predicted categories.
+    :param data_type: paloalto or chile
+    :return: categories of the documents
+    """
+
+    # the data type is validated first, so the metrics have no series of unknown data types
+    if data_type not in CLASSIFIER_SETTINGS:
+        abort(404)
+
+    with metrics_registry.timer('crowd_stage_seconds', data_type=data_type, stage='json_decode'):
+        data = request.get_json()
+    metrics_registry.inc('crowd_requests_total', data_type=data_type, endpoint='categorize')
+    top_k = data.get('top_k') or 0
+    if not isinstance(top_k, int) or top_k < 0:
+        abort(400)
+    if random.random() < metricsConfig['profile_sample_rate']:
+        results = profile_call(categorize_documents, data_type, data['document'], top_k)
+    else:
+        results = categorize_documents(data_type, data['document'], top_k)
 
     # return the results
-    return jsonify({'document': results})
+    with metrics_registry.timer('crowd_stage_seconds', data_type=data_type, stage='serialize'):
+        return jsonify({'document': results})
+
+
+@app.route('/api/v1/categorize/<data_type>/stream', methods=['POST'])
+def categorize_stream(data_type):
+    """
+    The REST API to categorize the input documents in a stream. The request body has one JSON document per line,
+    the documents are categorized in chunks, and the categorized documents of each chunk are streamed back
+    one JSON document per line as soon as the chunk is categorized.
+    :param data_type: paloalto or chile
+    :return: the stream of the categorized documents
+    """
+    if data_type not in CLASSIFIER_SETTINGS:
+        abort(404)
+    metrics_registry.inc('crowd_requests_total', data_type=data_type, endpoint='stream')
+
+    chunk_size = appConfig['stream_chunk_size']
+    lines = request.stream
+
+    def format_lines(docs):
+        return ''.join(json.dumps(doc) + '\n' for doc in docs)
+
+    def generate():
+        documents = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                document = json.loads(line)
+            except ValueError:
+                logger.exception('Invalid document line in the stream')
+                yield format_lines([{'error': 'Invalid document line: ' + line.strip()}])
+                return
+            if not isinstance(document, dict) or 'id' not in document or 'content' not in document:
+                logger.error('The document line has no id or content in the stream')
+                yield format_lines([{'error': 'The document line has no id or content: ' + line.strip()}])
+                return
+            documents.append(document)
+            if len(documents) == chunk_size:
+                yield format_lines(categorize_documents(data_type, documents))
+                documents = []
+        if documents:
+            yield format_lines(categorize_documents(data_type, documents))
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/api/v1/stats', methods=['GET'])
+def stats():
+    """
+    The REST API to get the statistics of the caches
+    :return: the cache statistics
+    """
+    return jsonify({
+        'prediction_cache': prediction_cache.stats(),
+        'stem_cache': stem_cache_info()
+    })
+
+
+@app.route('/api/v1/metrics', methods=['GET'])
+def metrics():
+    """
+    The REST API to get the metrics in the Prometheus text format, with the seconds of the prediction stages,
+    the batch sizes, the numbers of the documents and the requests, the cache statistics and the model versions
+    :return: the metrics text
+    """
+    gauges = {'crowd_cache_hits_total': [], 'crowd_cache_misses_total': [], 'crowd_cache_size': []}
+    caches = [({'cache': 'prediction'}, prediction_cache.stats())]
+    for language, info in stem_cache_info().items():
+        caches.append(({'cache': 'stem', 'language': language}, info))
+    for labels, info in caches:
+        gauges['crowd_cache_hits_total'].append((labels, info['hits']))
+        gauges['crowd_cache_misses_total'].append((labels, info['misses']))
+        gauges['crowd_cache_size'].append((labels, info['size']))
+    gauges['crowd_model_info'] = [({'data_type': data_type, 'version': classifier.version}, 1)
+                                  for data_type, classifier in classifiers.items()]
+    return Response(metrics_registry.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/v1/ready', methods=['GET'])
+def ready():
+    """
+    The REST API to get the load states of the classifiers. The status code is 200 if the preloaded classifiers
+    are ready, 503 otherwise.
+    :return: the load states
+    """
+    is_ready = all(load_states[data_type] == 'ready' for data_type in preload_data_types)
+    response = jsonify({'ready': is_ready, 'models': load_states})
+    response.status_code = 200 if is_ready else 503
+    return response
+
+
+@app.route('/api/v1/models', methods=['GET'])
+def models():
+    """
+    The REST API to get the model versions of each data type
+    :return: the loaded, the current and all the versions of each data type
+    """
+    result = {}
+    for data_type, settings in CLASSIFIER_SETTINGS.items():
+        classifier = classifiers.get(data_type)
+        result[data_type] = {
+            'loaded': classifier.version if classifier is not None else None,
+            'current': model_registry.current_version(settings['model_name']),
+            'versions': model_registry.list_versions(settings['model_name'])
+        }
+    return jsonify(result)
+
+
+@app.route('/api/v1/models/<data_type>/reload', methods=['POST'])
+def reload_model(data_type):
+    """
+    The REST API to reload the classifier of the data type in the background. The model version can be given
+    in the request body as {"version": "..."}, the current version in the registry is loaded otherwise.
+    :param data_type: paloalto or chile
+    :return: the model version to load, with the status code 202
+    """
+    if data_type not in CLASSIFIER_SETTINGS:
+        abort(404)
+
+    model_name = CLASSIFIER_SETTINGS[data_type]['model_name']
+    data = request.get_json(silent=True) or {}
+    version = data.get('version') or model_registry.current_version(model_name)
+    if version is None or version not in model_registry.list_versions(model_name):
+        abort(404)
+
+    thread = threading.Thread(target=reload_in_background, args=(data_type, version), name='reload-' + data_type)
+    thread.daemon = True
+    thread.start()
+
+    response = jsonify({'data_type': data_type, 'version': version})
+    response.status_code = 202
+    return response
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0')
+    # the requests must be handled concurrently to be coalesced
+    app.run(host='0.0.0.0', threaded=microBatchingConfig['enabled'])
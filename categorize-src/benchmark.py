@@ -0,0 +1,251 @@
+"""
+Copyright (C) 2016 TopCoder Inc., All Rights Reserved.
+
+It benchmarks the tokenization, the training of each level, the prediction at various batch sizes, the decision step,
+the model loading and the latency of the REST api, saves the results as JSON, and compares them with a baseline.
+
+@author TCSCODER
+@version 1.0
+"""
+
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import requests
+
+from classifier import CLASSIFIER_SETTINGS, create_classifier
+from config import setup_logging
+from load_data import load_data
+from metrics import registry as metrics_registry
+
+# the batch sizes to benchmark the prediction
+PREDICT_BATCH_SIZES = [1, 10, 100, 1000, 10000]
+
+# the batch sizes to benchmark the REST api
+HTTP_BATCH_SIZES = [1, 10, 100]
+
+# the percentiles of the REST api latency
+LATENCY_PERCENTILES = [50, 95, 99]
+
+
+def scale_data(data, scale, seed=42):
+    """
+    Scales up the data with the synthetic documents, each copy shuffles the words of the original documents,
+    so the copies are not identical to the originals.
+    :param data: the data, with the 'data' (contents) and the 'categories'
+    :param scale: the number of times of the original documents
+    :param seed: the random seed
+    :return: the scaled data
+    """
+    rand = random.Random(seed)
+    contents = list(data['data'])
+    categories = list(data['categories'])
+    for _ in range(1, scale):
+        for content, categories_item in zip(data['data'], data['categories']):
+            words = content.split()
+            rand.shuffle(words)
+            contents.append(u' '.join(words))
+            categories.append(categories_item)
+    return {'data': contents, 'categories': categories}
+
+
+def take(contents, size):
+    """
+    Takes the contents of the size, the contents are repeated if there are not enough of them.
+    :param contents: the contents
+    :param size: the number of the contents to take
+    :return: the taken contents
+    """
+    return list(itertools.islice(itertools.cycle(contents), size))
+
+
+def timed(func, repeat=1):
+    """
+    Times the function.
+    :param func: the function to call
+    :param repeat: the number of calls
+    :return: the min seconds of a call
+    """
+    best = None
+    for _ in range(0, repeat):
+        start_time = time.time()
+        func()
+        elapsed = time.time() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_classifier(data_type, data, repeat):
+    """
+    Benchmarks the classifier, it is trained with the data and saved to a temporary directory to be loaded again.
+    :param data_type: paloalto or chile
+    :param data: the data, with the 'data' (contents) and the 'categories'
+    :param repeat: the number of times to repeat the short benchmarks
+    :return: the metrics, in seconds
+    """
+    metrics = {}
+    contents = data['data']
+    clf = create_classifier(data_type)
+
+    print('Benchmark the tokenization of %d documents' % len(contents))
+    metrics['tokenize_seconds'] = timed(lambda: [clf.tokenize(content) for content in contents])
+
+    print('Benchmark the training of %d levels' % clf.category_level)
+    clf.fit(contents, data['categories'])
+    metrics['vectorize_fit_seconds'] = metrics_registry.histogram_sum('crowd_stage_seconds', data_type=data_type,
+                                                                      stage='fit_vectorize')
+    for i in range(0, clf.category_level):
+        metrics['fit_level_%d_seconds' % (i + 1)] = metrics_registry.histogram_sum(
+            'crowd_stage_seconds', data_type=data_type, stage='fit_level_%d' % (i + 1))
+
+    print('Benchmark the model loading')
+    models_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(models_dir, CLASSIFIER_SETTINGS[data_type]['model_name'])
+        clf.dump(filename)
+        metrics['load_mmap_seconds'] = timed(lambda: create_classifier(data_type).load(filename, mmap=True), repeat)
+        metrics['load_seconds'] = timed(lambda: create_classifier(data_type).load(filename, mmap=False), repeat)
+        clf = create_classifier(data_type)
+        clf.load(filename)
+
+        for batch_size in PREDICT_BATCH_SIZES:
+            print('Benchmark the prediction of the batch size %d' % batch_size)
+            batch = take(contents, batch_size)
+            metrics['predict_batch_%d_seconds' % batch_size] = timed(lambda: clf.predict(batch),
+                                                                     max(1, repeat * 100 // batch_size))
+
+        print('Benchmark the decision step')
+        batch = take(contents, 1000)
+        probabilities, _ = clf._predict_proba(clf.features.transform(batch))
+        metrics['decide_batch_1000_seconds'] = timed(lambda: clf._predict(probabilities), repeat)
+    finally:
+        shutil.rmtree(models_dir)
+    return metrics
+
+
+def benchmark_http(url, data_type, contents, n_requests):
+    """
+    Benchmarks the latency of the REST api. A unique nonce word is appended to each posted content, so the contents
+    are never answered by the prediction cache of the server, even when the contents are repeated or the benchmark
+    is run again.
+    :param url: the base url of the REST server
+    :param data_type: paloalto or chile
+    :param contents: the contents to send
+    :param n_requests: the number of requests of each batch size
+    :return: the metrics, in seconds
+    """
+    metrics = {}
+    session = requests.Session()
+    endpoint = url.rstrip('/') + '/api/v1/categorize/' + data_type
+    contents = itertools.cycle(contents)
+    run_id = '%08x' % random.getrandbits(32)
+    nonces = itertools.count()
+    for batch_size in HTTP_BATCH_SIZES:
+        print('Benchmark the REST api of the batch size %d' % batch_size)
+        latencies = []
+        for _ in range(0, n_requests):
+            documents = [{'id': str(j), 'content': u'%s bench%s%d' % (content, run_id, next(nonces))}
+                         for j, content in enumerate(itertools.islice(contents, batch_size))]
+            start_time = time.time()
+            response = session.post(endpoint, json={'document': documents})
+            response.raise_for_status()
+            latencies.append(time.time() - start_time)
+        for percentile in LATENCY_PERCENTILES:
+            metrics['http_batch_%d_p%d_seconds' % (batch_size, percentile)] = float(np.percentile(latencies,
+                                                                                                  percentile))
+    return metrics
+
+
+def compare(metrics, baseline, tolerance):
+    """
+    Compares the metrics with the baseline, and prints the comparison.
+    :param metrics: the metrics, in seconds
+    :param baseline: the baseline metrics, in seconds
+    :param tolerance: the max ratio of the slowdown that is not a regression
+    :return: the names of the regressed metrics
+    """
+    regressions = []
+    print('%-32s %-12s %-12s %s' % ('metric', 'baseline', 'current', 'ratio'))
+    for name in sorted(metrics):
+        if name not in baseline:
+            continue
+        ratio = metrics[name] / baseline[name] if baseline[name] > 0 else 1.0
+        regressed = ratio > 1 + tolerance
+        if regressed:
+            regressions.append(name)
+        print('%-32s %-12.6f %-12.6f %.3f%s' % (name, baseline[name], metrics[name], ratio,
+                                                ' REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    """
+    The main process
+    """
+    setup_logging()
+
+    # parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dataType', help='The data type, "paloalto" or "chile"')
+    parser.add_argument('dataFile', help='The labeled data file to benchmark with, xlsx, csv or jsonl')
+    parser.add_argument('--scale', type=int, default=1,
+                        help='Scale up the data file with the synthetic documents to the number of times')
+    parser.add_argument('--repeat', type=int, default=3, help='The number of times to repeat the short benchmarks')
+    parser.add_argument('--url', help='The base url of the running REST server to benchmark the latency')
+    parser.add_argument('--http-requests', type=int, default=100,
+                        help='The number of requests of each batch size to benchmark the REST api')
+    parser.add_argument('--output', default='benchmark.json', help='The JSON file to save the results')
+    parser.add_argument('--baseline', help='The JSON file of the baseline results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='The max ratio of the slowdown to the baseline that is not a regression')
+    args = parser.parse_args(sys.argv[1:])
+
+    # check file existence
+    if not os.path.isfile(args.dataFile):
+        print('The file does not exists: ' + args.dataFile)
+        sys.exit(-1)
+
+    if args.dataType not in CLASSIFIER_SETTINGS:
+        print('dataType can only be paloalto or chile')
+        sys.exit(-1)
+
+    data = scale_data(load_data(args.dataFile), args.scale)
+    metrics = benchmark_classifier(args.dataType, data, args.repeat)
+    if args.url:
+        metrics.update(benchmark_http(args.url, args.dataType, data['data'], args.http_requests))
+
+    results = {
+        'data_type': args.dataType,
+        'data_file': args.dataFile,
+        'documents': len(data['data']),
+        'scale': args.scale,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'metrics': metrics
+    }
+    with open(args.output, 'w') as fd:
+        json.dump(results, fd, indent=4, sort_keys=True)
+    print('The results are saved to ' + args.output)
+
+    if args.baseline:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+        regressions = compare(metrics, baseline['metrics'], args.tolerance)
+        if regressions:
+            print('The metrics are regressed: ' + ', '.join(regressions))
+            sys.exit(-1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Copyright (C) 2016 TopCoder Inc., All Rights Reserved.
+
+It reports the accuracy and the cost of the early exit across the category levels with each exit margin,
+to choose the early_exit_margin of the configuration.
+
+@author TCSCODER
+@version 1.0
+"""
+
+
+import argparse
+import os
+import sys
+
+from classifier import CLASSIFIER_SETTINGS, load_classifier
+from config import get_config, setup_logging
+from load_data import load_data
+
+# the exit margins to report by default, None evaluates all the levels
+DEFAULT_EXIT_MARGINS = [None, 1.0, 0.5, 0.25, 0.1, 0.05, 0.0]
+
+
+def main():
+    """
+    The main process
+    """
+    setup_logging()
+    appConfig = get_config()
+
+    # parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dataType', help='The data type, "paloalto" or "chile"')
+    parser.add_argument('dataFile', help='The labeled data file to predict, xlsx, csv or jsonl')
+    parser.add_argument('--margins', type=float, nargs='+',
+                        help='The exit margins to report, all the levels are always reported as the baseline')
+    args = parser.parse_args(sys.argv[1:])
+
+    # check file existence
+    if not os.path.isfile(args.dataFile):
+        print('The file does not exists: ' + args.dataFile)
+        sys.exit(-1)
+
+    if args.dataType not in CLASSIFIER_SETTINGS:
+        print('dataType can only be paloalto or chile')
+        sys.exit(-1)
+
+    exit_margins = DEFAULT_EXIT_MARGINS
+    if args.margins:
+        exit_margins = [None] + sorted(args.margins, reverse=True)
+
+    data = load_data(args.dataFile)
+    clf = load_classifier(args.dataType, appConfig['trained_models_dir'])
+    report = clf.cascade_report(data['data'], data['categories'], exit_margins)
+
+    baseline = report[0]
+    print('%-12s %-10s %-10s %-10s %-10s %s' % ('exit_margin', 'score', 'loss', 'cost', 'time', 'level_counts'))
+    for row in report:
+        print('%-12s %-10.4f %-10.4f %-10.4f %-10.3f %s' % (
+            'all' if row['exit_margin'] is None else row['exit_margin'], row['score'],
+            baseline['score'] - row['score'], row['cost'], row['time'],
+            ' '.join(str(count) for count in row['level_counts'])))
+
+
+if __name__ == '__main__':
+    main()
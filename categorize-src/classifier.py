@@ -7,33 +7,116 @@ Classifiers the text documents. It provides method to train(fit) or predict.
 @version 1.0
 """
 
-import json
+import hashlib
 import nltk
+import numpy as np
+import os
+import scipy.sparse as sp
 import string
-
+import threading
+import time
+
+from collections import OrderedDict
+from config import get_config
+from metrics import registry as metrics_registry
+from model_file import read_model_file, write_model_file
+from model_registry import ModelRegistry
 from nltk import word_tokenize
 from nltk.stem.snowball import SnowballStemmer
-from sklearn.externals import joblib
+from sklearn.externals.joblib import Parallel, delayed
 from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer
 from sklearn.feature_extraction.text import TfidfTransformer
 from sklearn.linear_model import SGDClassifier
 from sklearn.pipeline import Pipeline
 
-# load configuration
-with open('conf/config.json', 'rt') as fd:
-    appConfig = json.load(fd)
 
-# set the nltk data path if necessary
-if appConfig['nltk_data_path']:
-    nltk.data.path.append(appConfig['nltk_data_path'])
 
+class StemCache:
+    """
+    The stemmer with a bounded LRU cache of the stemmed tokens.
+    """
 
-# create the stemmers
+    def __init__(self, stemmer, max_size):
+        """
+        Initialize the stem cache
+        :param stemmer: the stemmer
+        :param max_size: the max number of cached tokens, 0 to disable the cache
+        """
+        self.stemmer = stemmer
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stem(self, token):
+        """
+        Stem the token, the cached stem is used if exists.
+        :param token: the token to stem
+        :return: the stemmed token
+        """
+        if self.max_size <= 0:
+            return self.stemmer.stem(token)
+
+        with self._lock:
+            stem = self._cache.pop(token, None)
+            if stem is not None:
+                # move the token to the most recently used end
+                self._cache[token] = stem
+                self.hits += 1
+                return stem
+            self.misses += 1
+
+        stem = self.stemmer.stem(token)
+        with self._lock:
+            self._cache[token] = stem
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return stem
+
+    def info(self):
+        """
+        Gets the statistics of the cache.
+        :return: the statistics dictionary
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._cache),
+            'max_size': self.max_size
+        }
+
+
+# the stemmers of each language, they are created on first use
 stemmers = dict()
-stemmers['english'] = SnowballStemmer('english', ignore_stopwords=True)
-stemmers['spanish'] = SnowballStemmer('spanish', ignore_stopwords=True)
+stemmers_lock = threading.Lock()
+
+punctuations = set(string.punctuation)
+
+# the probability under which a category is ignored
+MIN_PROBABILITY = 1e-9
 
-punctuations = list(string.punctuation)
+
+def get_stemmer(language):
+    """
+    Gets the stemmer of the language. The nltk data path is set and the stemmer is created on the first call.
+    :param language: the language, english or spanish
+    :return: the stemmer
+    """
+    stemmer = stemmers.get(language)
+    if stemmer is None:
+        with stemmers_lock:
+            if not stemmers:
+                # set the nltk data path if necessary
+                nltk_data_path = get_config()['nltk_data_path']
+                if nltk_data_path and nltk_data_path not in nltk.data.path:
+                    nltk.data.path.append(nltk_data_path)
+            if language not in stemmers:
+                stemmers[language] = StemCache(SnowballStemmer(language, ignore_stopwords=True),
+                                               get_config().get('stem_cache_size', 100000))
+            stemmer = stemmers[language]
+    return stemmer
 
 
 def stem_tokens(tokens, stemmer):
@@ -49,15 +132,38 @@ def stem_tokens(tokens, stemmer):
     return stemmed
 
 
+def stem_cache_info():
+    """
+    Gets the statistics of the stem caches.
+    :return: the statistics of each language
+    """
+    return dict((language, stemmer.info()) for language, stemmer in stemmers.items())
+
+
+# the seconds spent in the tokenizers by each thread, to tell the tokenization from the vectorization
+tokenize_timer = threading.local()
+
+
+def add_tokenize_seconds(start_time):
+    """
+    Adds the seconds since the start time to the tokenization seconds of the current thread.
+    :param start_time: the start time of the tokenization
+    """
+    tokenize_timer.seconds = getattr(tokenize_timer, 'seconds', 0.0) + time.time() - start_time
+
+
 def english_tokenize(text):
     """
     the text to tokenize for english.
     :param text: the text
     :return: the tokens array
     """
+    start_time = time.time()
+    stemmer = get_stemmer('english')
     tokens = word_tokenize(text, 'english')
-    stems = stem_tokens(tokens, stemmers['english'])
+    stems = stem_tokens(tokens, stemmer)
     stems = [i for i in stems if i not in punctuations]
+    add_tokenize_seconds(start_time)
     return stems
 
 
@@ -67,80 +173,279 @@ def spanish_tokenize(text):
     :param text: the text
     :return: the tokens array
     """
+    start_time = time.time()
+    stemmer = get_stemmer('spanish')
     tokens = word_tokenize(text, 'spanish')
-    stems = stem_tokens(tokens, stemmers['spanish'])
+    stems = stem_tokens(tokens, stemmer)
     stems = [i for i in stems if i not in punctuations]
+    add_tokenize_seconds(start_time)
     return stems
 
 
+def fit_level(clf, features, categories):
+    """
+    Fit the classifier of one level, it may run in a separate process.
+    :param clf: the level classifier
+    :param features: the features of the contents
+    :param categories: the category labels of the level
+    :return: the fitted classifier, and the seconds of the fitting
+    """
+    start_time = time.time()
+    clf = clf.fit(features, categories)
+    return clf, time.time() - start_time
+
+
 class CrowdClassifier:
     """
     The classifier for text classification.
     """
 
-    def __init__(self, category_level, level_scores, language, loss):
+    def __init__(self, category_level, level_scores, language, loss, feature_mode='vocabulary', n_features=2 ** 16):
         """
         Initialize the classifier
         :param category_level: the category level, 1 for chile, and 5 for palo alto
         :param level_scores: the scores
         :param language: the language, english or spanish
         :param loss: the SVM loss parameter
+        :param feature_mode: the feature mode, 'vocabulary' to count the words of the fitted vocabulary,
+        or 'hashing' to count the hashed words without vocabulary
+        :param n_features: the number of hashed features in the hashing mode
         """
-        self.classifiers = []
-        self.category_level = 0
-        self.level_scores = []
-        for i in range(0, category_level):
-            tokenize = english_tokenize
-            if language == 'spanish':
-                tokenize = spanish_tokenize
+        if feature_mode not in ('vocabulary', 'hashing'):
+            raise ValueError('The feature mode can only be vocabulary or hashing: ' + feature_mode)
 
-            internal_classifier = SGDClassifier(loss=loss, penalty='l2', alpha=0.0001, n_iter=10, random_state=42)
+        self.loss = loss
+        self.tokenize = english_tokenize
+        if language == 'spanish':
+            self.tokenize = spanish_tokenize
+        self.feature_mode = feature_mode
+        self.n_features = n_features
 
-            clf = Pipeline([('vect', CountVectorizer(ngram_range=(1, 1), tokenizer=tokenize)),
-                                 ('tfidf', TfidfTransformer(use_idf=True)),
-                                 ('clf', internal_classifier),
-                                 ])
+        # the features are shared by all the levels, so each document is tokenized only once
+        self.features = Pipeline([('vect', self._create_vectorizer()),
+                                  ('tfidf', TfidfTransformer(use_idf=True)),
+                                  ])
 
-            self.classifiers.append(clf)
+        self.classifiers = []
+        for i in range(0, category_level):
+            self.classifiers.append(self._create_level_classifier())
 
         self.category_level = category_level
         self.level_scores = level_scores
+        self.language = language
+        self.version = None
+        # the data type of the recorded metrics
+        self.data_type = None
+        # the fraction of the deeper level scores that may be lost by skipping the deeper levels of a content,
+        # None to always evaluate all the levels
+        self.exit_margin = None
+
+    def _create_vectorizer(self):
+        """
+        Creates the vectorizer to count the words of the feature mode.
+        :return: the vectorizer
+        """
+        if self.feature_mode == 'hashing':
+            # the counts are normalized by the tfidf transformer
+            return HashingVectorizer(ngram_range=(1, 1), tokenizer=self.tokenize, n_features=self.n_features,
+                                     norm=None, non_negative=True)
+        return CountVectorizer(ngram_range=(1, 1), tokenizer=self.tokenize)
 
-    def fit(self, contents, categories):
+    def _create_level_classifier(self):
+        """
+        Creates the classifier of one level.
+        :return: the level classifier
+        """
+        return SGDClassifier(loss=self.loss, penalty='l2', alpha=0.0001, n_iter=10, random_state=42)
+
+    def fit(self, contents, categories, n_jobs=1):
         """
         Fit the contents to the categories. This is the trainning method.
         :param contents: the contents.
         :param categories: the categories
+        :param n_jobs: the number of processes to train the levels in parallel
         :return: the classifier.
         """
-        for i in range(0, self.category_level):
-            level_categories = []
-            level_contents = []
-            for idx, content in enumerate(contents):
-                category_label = self._get_category_label(categories[idx], i)
-                level_categories.append(category_label)
-                level_contents.append(content)
-            # train the level classifier
-            self.classifiers[i].fit(level_contents, level_categories)
+        with metrics_registry.timer('crowd_stage_seconds', data_type=self.data_type, stage='fit_vectorize'):
+            features = self.features.fit_transform(contents)
+
+        # the category labels of each level
+        level_categories = zip(*[self._get_category_labels(category, self.category_level) for category in categories])
+
+        # train the level classifiers, they are independent of each other, so the seconds are measured by each process
+        fitted = Parallel(n_jobs=n_jobs)(
+            delayed(fit_level)(clf, features, level_categories[i]) for i, clf in enumerate(self.classifiers))
+        self.classifiers = []
+        for i, (clf, seconds) in enumerate(fitted):
+            self.classifiers.append(clf)
+            metrics_registry.observe('crowd_stage_seconds', seconds, data_type=self.data_type,
+                                     stage='fit_level_%d' % (i + 1))
+        self._build_hierarchy()
+        return self
+
+    def fit_stream(self, chunks, n_epochs=10):
+        """
+        Fit the contents streamed in chunks, so all the contents are never in memory at once.
+        Only the hashing feature mode is supported, because the vocabulary must be fitted with all the contents.
+        :param chunks: the function that returns a new iterator of the chunks, each chunk is a dictionary
+        with the 'data' (contents) and the 'categories'
+        :param n_epochs: the number of passes over the chunks to train the level classifiers
+        :return: the classifier.
+        """
+        if self.feature_mode != 'hashing':
+            raise ValueError('Only the hashing feature mode can be fitted with the streamed contents')
+
+        # the first pass counts the document frequencies, and collects the categories of each level
+        vect = self.features.named_steps['vect']
+        document_counts = np.zeros(self.n_features)
+        n_samples = 0
+        level_classes = [set() for _ in range(0, self.category_level)]
+        for chunk in chunks():
+            counts = vect.transform(chunk['data'])
+            document_counts += np.bincount(counts.indices, minlength=self.n_features)
+            n_samples += counts.shape[0]
+            for category in chunk['categories']:
+                for i, category_label in enumerate(self._get_category_labels(category, self.category_level)):
+                    level_classes[i].add(category_label)
+
+        # the same smoothed idf as the TfidfTransformer
+        idf = np.log(float(n_samples + 1) / (document_counts + 1)) + 1.0
+        self.features.named_steps['tfidf']._idf_diag = sp.spdiags(idf, diags=0, m=len(idf), n=len(idf))
+
+        level_classes = [np.array(sorted(classes)) for classes in level_classes]
+        for _ in range(0, n_epochs):
+            for chunk in chunks():
+                features = self.features.transform(chunk['data'])
+                level_categories = zip(*[self._get_category_labels(category, self.category_level)
+                                         for category in chunk['categories']])
+                for i, clf in enumerate(self.classifiers):
+                    clf.partial_fit(features, level_categories[i], classes=level_classes[i])
+        self._build_hierarchy()
+        return self
+
+    def partial_fit(self, contents, categories):
+        """
+        Updates the fitted classifiers with more contents. The vocabulary of the features is frozen,
+        so the unknown words are ignored, and the new categories are added to the classifiers.
+        :param contents: the contents.
+        :param categories: the categories
+        :return: the classifier.
+        """
+        features = self.features.transform(contents)
+
+        level_categories = zip(*[self._get_category_labels(category, self.category_level) for category in categories])
+        for i, clf in enumerate(self.classifiers):
+            self._add_classes(clf, level_categories[i])
+            clf.partial_fit(features, level_categories[i], classes=clf.classes_)
+        self._build_hierarchy()
         return self
 
+    def compact(self, threshold):
+        """
+        Compacts the fitted classifiers for the prediction. The weights less than the threshold in absolute value
+        are pruned, and the weights are stored as float32 sparse matrices. The compacted classifiers are densified
+        again when they are loaded to update.
+        :param threshold: the min absolute value of the weights to keep
+        :return: the number of the kept weights and the number of all the weights
+        """
+        kept = 0
+        total = 0
+        for clf in self.classifiers:
+            coef = clf.coef_.toarray() if sp.issparse(clf.coef_) else np.asarray(clf.coef_)
+            coef = np.where(np.abs(coef) >= threshold, coef, 0.0).astype(np.float32)
+            clf.coef_ = sp.csr_matrix(coef)
+            kept += clf.coef_.nnz
+            total += coef.size
+        return kept, total
+
     def dump(self, filename):
         """
-        Persist the classifiers.
-        :param filename: the filename to save the classifiers.
+        Persist the classifiers to a single model file.
+        :param filename: the filename to save the classifiers, the '.model' extension is appended.
         """
+        header = {
+            'category_level': self.category_level,
+            'language': self.language,
+            'loss': self.loss,
+            'feature_mode': self.feature_mode,
+            'n_features': self.n_features,
+            'coef_format': 'sparse' if any(sp.issparse(clf.coef_) for clf in self.classifiers) else 'dense',
+            'classes': [],
+            # the learning rate schedule of each level, so the updates continue it instead of restarting it
+            't': []
+        }
+        arrays = {
+            'idf': self.features.named_steps['tfidf'].idf_
+        }
+        if self.feature_mode == 'vocabulary':
+            vocabulary = self.features.named_steps['vect'].vocabulary_
+            terms = [None] * len(vocabulary)
+            for term, idx in vocabulary.items():
+                terms[idx] = term if isinstance(term, unicode) else term.decode('utf-8')
+            arrays['vocabulary'] = np.frombuffer(u'\n'.join(terms).encode('utf-8'), dtype=np.uint8)
+
         for idx, clf in enumerate(self.classifiers):
-            joblib.dump(clf, filename + '.level_%d' % (idx + 1))
+            header['classes'].append(list(clf.classes_))
+            header['t'].append(float(getattr(clf, 't_', 1.0)))
+            if header['coef_format'] == 'sparse':
+                coef = sp.csr_matrix(clf.coef_)
+                arrays['coef_%d_data' % (idx + 1)] = coef.data
+                arrays['coef_%d_indices' % (idx + 1)] = coef.indices
+                arrays['coef_%d_indptr' % (idx + 1)] = coef.indptr
+            else:
+                arrays['coef_%d' % (idx + 1)] = clf.coef_
+            arrays['intercept_%d' % (idx + 1)] = clf.intercept_
+        write_model_file(filename + '.model', header, arrays)
 
-    def load(self, filename):
+    def load(self, filename, mmap=True):
         """
-        Loads the classifiers from file.
-        :param filename: the filename.
+        Loads the classifiers from the model file.
+        :param filename: the filename, without the '.model' extension.
+        :param mmap: True to memory-map the weights read-only, False to load them for updating
         """
+        model_filename = filename + '.model'
+        header, arrays = read_model_file(model_filename, mmap)
+        if header['category_level'] != self.category_level:
+            raise ValueError('The model file has %d levels, but %d levels are expected: %s'
+                             % (header['category_level'], self.category_level, model_filename))
+
+        self.feature_mode = header['feature_mode']
+        self.n_features = header['n_features']
+        vect = self._create_vectorizer()
+        if self.feature_mode == 'vocabulary':
+            # the vocabulary is frozen, it is not validated again
+            terms = arrays['vocabulary'].tostring().decode('utf-8').split(u'\n') if len(arrays['vocabulary']) else []
+            vect.vocabulary_ = dict(zip(terms, range(0, len(terms))))
+            vect.fixed_vocabulary_ = True
+
+        idf = arrays['idf']
+        tfidf = TfidfTransformer(use_idf=True)
+        tfidf._idf_diag = sp.spdiags(idf, diags=0, m=len(idf), n=len(idf))
+        self.features = Pipeline([('vect', vect), ('tfidf', tfidf)])
+
         self.classifiers = []
         for i in range(0, self.category_level):
-            clf = joblib.load(filename + '.level_%d' % (i + 1))
+            clf = self._create_level_classifier()
+            clf.classes_ = np.array(header['classes'][i])
+            if header.get('coef_format') == 'sparse':
+                indptr = arrays['coef_%d_indptr' % (i + 1)]
+                clf.coef_ = sp.csr_matrix((arrays['coef_%d_data' % (i + 1)], arrays['coef_%d_indices' % (i + 1)],
+                                           indptr), shape=(len(indptr) - 1, len(idf)))
+                if not mmap:
+                    # the classifiers are updated with the dense weights
+                    clf.coef_ = clf.coef_.toarray().astype(np.float64)
+            else:
+                clf.coef_ = arrays['coef_%d' % (i + 1)]
+            clf.intercept_ = arrays['intercept_%d' % (i + 1)]
+            if 't' in header:
+                clf.t_ = header['t'][i]
             self.classifiers.append(clf)
+        self._build_hierarchy()
+
+        # the version identifies the loaded model file
+        stat = os.stat(model_filename)
+        fingerprint = hashlib.sha1('%s:%d:%d' % (model_filename, stat.st_size, stat.st_mtime))
+        self.version = fingerprint.hexdigest()[:12]
 
     def predict(self, contents):
         """
@@ -148,100 +453,211 @@ class CrowdClassifier:
         :param contents: the contents to predict.
         :return: the predicted result (categories)
         """
+        metrics_registry.observe('crowd_batch_size', len(contents), data_type=self.data_type, source='predict')
+        features = self._transform(contents)
+        probabilities, _ = self._predict_proba(features, self.exit_margin)
+        with metrics_registry.timer('crowd_stage_seconds', data_type=self.data_type, stage='decide'):
+            return self._predict(probabilities)
+
+    def _transform(self, contents):
+        """
+        Transforms the contents to the features, the seconds of the tokenization and the vectorization are recorded.
+        :param contents: the contents
+        :return: the features of the contents
+        """
+        tokenize_timer.seconds = 0.0
+        start_time = time.time()
+        features = self.features.transform(contents)
+        elapsed = time.time() - start_time
+        metrics_registry.observe('crowd_stage_seconds', tokenize_timer.seconds, data_type=self.data_type,
+                                 stage='tokenize')
+        metrics_registry.observe('crowd_stage_seconds', elapsed - tokenize_timer.seconds, data_type=self.data_type,
+                                 stage='vectorize')
+        return features
+
+    def _predict_proba(self, features, exit_margin=None):
+        """
+        Predicts the probabilities of all the levels. With the exit margin, the levels are evaluated one by one, and
+        a content exits after a level when no label of the deeper levels can score more than its second best expected
+        score of the evaluated levels plus the exit margin times the sum of the level scores of the deeper levels.
+        The probabilities of the skipped levels are zeros, so the categories are decided by the evaluated levels.
+        :param features: the features of the contents
+        :param exit_margin: the fraction of the deeper level scores that may be lost by skipping the deeper levels,
+        0 skips them only if they cannot change the categories, None to evaluate all the levels
+        :return: the stacked probabilities of all the classifiers, one row per content, and the number of the
+        contents evaluated by each level
+        """
+        if exit_margin is None:
+            level_probabilities = []
+            for i, clf in enumerate(self.classifiers):
+                with metrics_registry.timer('crowd_stage_seconds', data_type=self.data_type,
+                                            stage='predict_proba_%d' % (i + 1)):
+                    level_probabilities.append(clf.predict_proba(features))
+            return np.hstack(level_probabilities), [features.shape[0]] * len(self.classifiers)
+
+        probabilities = np.zeros((features.shape[0], len(self.labels)))
+        level_counts = []
+        active = np.arange(features.shape[0])
+        for i, clf in enumerate(self.classifiers):
+            start, end = self.level_offsets[i], self.level_offsets[i + 1]
+            with metrics_registry.timer('crowd_stage_seconds', data_type=self.data_type,
+                                        stage='predict_proba_%d' % (i + 1)):
+                probabilities[active[:, np.newaxis], np.arange(start, end)] = clf.predict_proba(features[active])
+            level_counts.append(len(active))
+            if i == len(self.classifiers) - 1:
+                break
+
+            # the expected scores of the labels of the evaluated levels, a label of a deeper level scores at most
+            # the score of its label of this level plus the probability of that label times the deeper level scores
+            candidates = probabilities[active] >= MIN_PROBABILITY
+            weights = np.where(candidates, probabilities[active], 0.0)
+            scores = weights.dot(self.primary_scores.T)
+            remaining = sum(self.level_scores[i + 1:self.category_level])
+            bounds = (scores[:, start:end] + weights[:, start:end] * remaining).max(axis=1)
+
+            # the deeper levels are skipped only if none of their labels can beat the primary or the secondary,
+            # the bound of the branch of the primary is included, so the extensions of the primary are never lost
+            scores[~candidates] = -np.inf
+            if scores.shape[1] > 1:
+                second = np.partition(scores, -2, axis=1)[:, -2]
+            else:
+                second = np.full(len(active), -np.inf)
+            active = active[~(bounds <= second + exit_margin * remaining)]
+            if not len(active):
+                level_counts.extend([0] * (len(self.classifiers) - i - 1))
+                break
+        return probabilities, level_counts
+
+    def predict_details(self, contents, top_k=3):
+        """
+        Predicts the contents, with the top k categories of each level and the expected scores of the decision.
+        The details are computed from the same probabilities as the predicted categories, with the same exit margin.
+        :param contents: the contents to predict.
+        :param top_k: the number of the most probable categories of each level
+        :return: the predicted details, one dict per content, with the categories, the expected score of the primary
+        category, the expected score of both the primary and the secondary categories, and the top categories of each
+        level as the lists of (categories, probability) tuples
+        """
+        features = self._transform(contents)
+        probabilities, _ = self._predict_proba(features, self.exit_margin)
+        primary, primary_scores, secondary, secondary_scores = self._decide(probabilities)
+
+        # the most probable labels of each level, the stable sort keeps the label order of the ties
+        levels = []
+        for start, end in zip(self.level_offsets[:-1], self.level_offsets[1:]):
+            top = np.argsort(-probabilities[:, start:end], axis=1, kind='mergesort')[:, :top_k] + start
+            levels.append((top, probabilities[np.arange(len(top))[:, np.newaxis], top]))
+
         result = []
-        probabilities = {}
-        for idx, clf in enumerate(self.classifiers):
-            predicts = clf.predict_proba(contents)
-            for i in range(0, len(contents)):
-                if i not in probabilities:
-                    probabilities[i] = {}
-                for idx2, class_label in enumerate(clf.classes_):
-                    probabilities[i][class_label] = predicts[i][idx2]
-
-        for i in range(0, len(contents)):
-            result.append(self._predict(probabilities[i]))
+        for i in range(0, len(primary)):
+            result.append({
+                'categories': [self.label_categories[primary[i]], self.label_categories[secondary[i]]],
+                'primary_score': float(primary_scores[i]),
+                'secondary_score': float(secondary_scores[i]),
+                'levels': [[(self.label_categories[idx], float(p)) for idx, p in zip(top[i], top_probabilities[i])]
+                           for top, top_probabilities in levels]
+            })
         return result
 
-    def _predict(self, probabilities):
+    def _build_hierarchy(self):
         """
-        This is the helper method for predict a single content.
-        :param probabilities: the probabilities of each classifier.
-        :return: the predicted result
+        Precomputes the label hierarchy and the expected score matrices used by _predict.
+        It must be called whenever the classifiers are fitted or loaded.
         """
-        child_categories = []
-        for i in range(0, self.category_level):
-            child_categories.append({})
-            for category_label in self.classifiers[i].classes_:
-                main_category = self._get_categories(category_label)[0]
-                if main_category not in child_categories[i]:
-                    child_categories[i][main_category] = []
-                child_categories[i][main_category].append(category_label)
+        # the labels of all the levels, in the same order as the stacked probabilities
+        self.labels = []
+        label_levels = []
+        for i, clf in enumerate(self.classifiers):
+            self.labels.extend(clf.classes_)
+            label_levels.extend([i] * len(clf.classes_))
+        self.label_levels = np.array(label_levels)
+        self.level_offsets = np.concatenate(([0], np.cumsum([len(clf.classes_) for clf in self.classifiers])))
+        self.label_categories = [self._get_categories(category_label) for category_label in self.labels]
+
+        # encode the category of each level as integer, the empty category (None) is encoded as well
+        codes = np.zeros((len(self.labels), self.category_level), dtype=np.int32)
+        level_codes = [{} for _ in range(0, self.category_level)]
+        for idx, category_label in enumerate(self.labels):
+            categories = self._get_categories(category_label)
+            for i in range(0, self.category_level):
+                value = categories[i] if i < len(categories) else None
+                codes[idx, i] = level_codes[i].setdefault(value, len(level_codes[i]))
+        self.main_categories = codes[:, 0]
+
+        # the number of leading levels two labels have in common, up to the level of the actual label
+        matched = np.cumprod(codes[:, np.newaxis, :] == codes[np.newaxis, :, :], axis=2).sum(axis=2)
+        matched = np.minimum(matched, self.label_levels[np.newaxis, :] + 1)
+
+        # match_scores[predicted, actual] is the score when only the predicted label is given
+        cumulative_scores = np.concatenate(([0.0], np.cumsum(self.level_scores[:self.category_level])))
+        self.match_scores = cumulative_scores[matched]
+
+        # the sibling groups, i.e. the labels of the same level with the same main category
+        self.same_level = self.label_levels[:, np.newaxis] == self.label_levels[np.newaxis, :]
+        self.siblings = self.same_level & (self.main_categories[:, np.newaxis] == self.main_categories[np.newaxis, :])
+        self.primary_scores = self.match_scores * self.siblings
+
+    def _secondary_scores(self, primary):
+        """
+        Gets the expected score matrix of the secondary labels for the given primary label.
+        :param primary: the index of the primary label
+        :return: the score matrix, indexed by [secondary, actual]
+        """
+        primary_scores = self.match_scores[primary]
+        scores = np.where(self.match_scores > primary_scores,
+                          0.5 * (self.match_scores + primary_scores), primary_scores)
+        candidates = self.siblings | (self.main_categories == self.main_categories[primary])
+        return scores * (self.same_level & candidates)
+
+    def cascade_report(self, contents, categories, exit_margins):
+        """
+        Reports the accuracy and the cost of the early exit with each exit margin, to choose the exit margin.
+        :param contents: the contents to predict
+        :param categories: the actual categories of the contents
+        :param exit_margins: the exit margins to report, None to evaluate all the levels
+        :return: one dict per exit margin, with the average score, the number of the contents evaluated by each
+        level, the fraction of the level evaluations and the prediction time in seconds
+        """
+        features = self.features.transform(contents)
+        result = []
+        for exit_margin in exit_margins:
+            start_time = time.time()
+            probabilities, level_counts = self._predict_proba(features, exit_margin)
+            predicted = self._predict(probabilities)
+            elapsed = time.time() - start_time
+            result.append({
+                'exit_margin': exit_margin,
+                'score': self.score(predicted, categories),
+                'level_counts': level_counts,
+                'cost': float(sum(level_counts)) / (len(contents) * len(self.classifiers)),
+                'time': elapsed
+            })
+        return result
 
-        # find the primary category
-        max_score = -1
-        primary_category_label = None
+    def score(self, predicted, categories):
+        """
+        Scores the predicted result by the actual categories.
+        :param predicted: the predicted result
+        :param categories: the actual categories
+        :return: the average score
+        """
+        total_score = 0.0
+        for predicted_item, categories_item in zip(predicted, categories):
+            total_score += self._cal_score(predicted_item[0], predicted_item[1], categories_item)
+        return total_score / max(len(predicted), 1)
 
-        for i in range(0, self.category_level):
-            for category_label in self.classifiers[i].classes_:
-                if probabilities[category_label] < 1e-9:
-                    continue
-                total_score = 0
-                main_category = self._get_categories(category_label)[0]
-                candidates = child_categories[i][main_category]
-                for actual_label in candidates:
-                    probability = probabilities[actual_label]
-                    if probability < 1e-9:
-                        continue
-                    score = self._cal_score(category_label, None, actual_label, i)
-                    total_score += score * probability
-                if total_score > max_score:
-                    max_score = total_score
-                    primary_category_label = category_label
-
-        # find the secondary category
-        max_score = -1
-        secondary_category_label = None
-        for i in range(0, self.category_level):
-            for category_label in self.classifiers[i].classes_:
-                if probabilities[category_label] < 1e-9 and secondary_category_label:
-                    continue
-                if category_label == primary_category_label:
-                    continue
-                total_score = 0
-                main_category = self._get_categories(category_label)[0]
-                main_category2 = self._get_categories(primary_category_label)[0]
-                candidates = list(set(child_categories[i][main_category] + child_categories[i][main_category2]))
-                for actual_label in candidates:
-                    probability = probabilities[actual_label]
-                    if probability < 1e-9:
-                        continue
-                    score = self._cal_score(primary_category_label, category_label, actual_label, i)
-                    total_score += score * probability
-                if total_score > max_score:
-                    max_score = total_score
-                    secondary_category_label = category_label
-
-        return [self._get_categories(primary_category_label), self._get_categories(secondary_category_label)]
-
-    def _cal_score(self, primary_category_label, secondary_category_label, actual_category_label, max_level):
+    def _cal_score(self, primary_categories, secondary_categories, actual_categories):
         """
         This is a helper method to calculate the score for a predict result.
-        :param primary_category_label: the primary category
-        :param secondary_category_label: the secondary category
-        :param actual_category_label: the actual category
-        :param max_level: the max level we concerned
+        :param primary_categories: the primary category (array representation)
+        :param secondary_categories: the secondary category (array representation)
+        :param actual_categories: the actual category (array representation)
         :return: the score
         """
-        primary_categories = self._get_categories(primary_category_label)
-        if not secondary_category_label:
-            secondary_categories = None
-        else:
-            secondary_categories = self._get_categories(secondary_category_label)
-        actual_categories = self._get_categories(actual_category_label)
         total_score = 0
         ignored_primary = False
         ignored_secondary = False
-        for i in range(0, max_level + 1):
+        for i in range(0, self.category_level):
             if primary_categories and i < len(primary_categories):
                 pv = primary_categories[i]
             else:
@@ -254,42 +670,109 @@ class CrowdClassifier:
                 sv = secondary_categories[i]
             else:
                 sv = None
-            primary_equal = pv == av
-            secondary_equal = (secondary_categories is not None) and sv == av
-            if not primary_equal:
+            if pv != av:
                 ignored_primary = True
-            if not secondary_equal:
+            if secondary_categories is None or sv != av:
                 ignored_secondary = True
 
             if not ignored_primary:
                 total_score += self.level_scores[i]
-
             if ignored_primary and (not ignored_secondary):
                 total_score += 0.5 * self.level_scores[i]
-
         return total_score
 
+    def _decide(self, probabilities):
+        """
+        Decides the primary and the secondary labels of the contents by the expected scores.
+        :param probabilities: the stacked probabilities of all the classifiers, one row per content.
+        :return: the primary label indexes, their expected scores, the secondary label indexes, their expected scores
+        """
+        candidates = probabilities >= MIN_PROBABILITY
+        weights = np.where(candidates, probabilities, 0.0)
+
+        # find the primary categories
+        scores = weights.dot(self.primary_scores.T)
+        scores[~candidates] = -np.inf
+        primary = scores.argmax(axis=1)
+        primary_scores = scores[np.arange(len(primary)), primary]
+
+        # find the secondary categories, grouped by the primary category
+        secondary = np.zeros_like(primary)
+        secondary_scores = np.zeros(len(primary))
+        for label_idx in np.unique(primary):
+            rows = np.flatnonzero(primary == label_idx)
+            scores = weights[rows].dot(self._secondary_scores(label_idx).T)
+            allowed = candidates[rows]
+            # the first label is always considered, even if it is unlikely
+            allowed[:, 1 if label_idx == 0 else 0] = True
+            allowed[:, label_idx] = False
+            scores[~allowed] = -np.inf
+            secondary[rows] = scores.argmax(axis=1)
+            secondary_scores[rows] = scores[np.arange(len(rows)), secondary[rows]]
+        return primary, primary_scores, secondary, secondary_scores
+
+    def _predict(self, probabilities):
+        """
+        This is the helper method to decide the categories of the contents.
+        :param probabilities: the stacked probabilities of all the classifiers, one row per content.
+        :return: the predicted result
+        """
+        primary, _, secondary, _ = self._decide(probabilities)
+
+        result = []
+        for i in range(0, len(primary)):
+            result.append([self.label_categories[primary[i]], self.label_categories[secondary[i]]])
+        return result
+
     @staticmethod
-    def _get_category_label(category_obj, level):
+    def _add_classes(clf, category_labels):
         """
-        Gets the category label
+        Adds the new category labels to the fitted level classifier, their weights start from zero.
+        :param clf: the level classifier
+        :param category_labels: the category labels to fit
+        """
+        new_labels = set(category_labels) - set(clf.classes_)
+        if not new_labels:
+            return
+
+        classes = np.array(sorted(set(clf.classes_) | new_labels))
+        if len(clf.classes_) == 2:
+            # the binary classifier only has the weights of the second class
+            old_coef = np.vstack((-clf.coef_[0], clf.coef_[0]))
+            old_intercept = np.array([-clf.intercept_[0], clf.intercept_[0]])
+        else:
+            old_coef = clf.coef_
+            old_intercept = clf.intercept_
+
+        coef = np.zeros((len(classes), old_coef.shape[1]), dtype=np.float64)
+        intercept = np.zeros(len(classes), dtype=np.float64)
+        old_indexes = np.searchsorted(classes, clf.classes_)
+        coef[old_indexes] = old_coef
+        intercept[old_indexes] = old_intercept
+
+        clf.classes_ = classes
+        clf.coef_ = coef
+        clf.intercept_ = intercept
+
+    @staticmethod
+    def _get_category_labels(category_obj, category_level):
+        """
+        Gets the category labels of all the levels
         :param category_obj: the category object. (array representation)
-        :param level: the level
-        :return: the category (string representation)
+        :param category_level: the number of levels
+        :return: the category of each level (string representation)
         """
-        result = ''
-        for i in range(0, level + 1):
-            if i < len(category_obj):
+        result = []
+        for i in range(0, category_level):
+            if i < len(category_obj) and category_obj[i]:
                 level_label = category_obj[i]
-                if not level_label:
-                    level_label = '$'
             else:
                 # place holder
                 level_label = '$'
             if not result:
-                result = level_label
+                result.append(level_label)
             else:
-                result = result + '###' + level_label
+                result.append(result[-1] + '###' + level_label)
         return result
 
     @staticmethod
@@ -302,3 +785,97 @@ class CrowdClassifier:
         if not category_label:
             return None
         return map(lambda x: x if x != '$' else None, category_label.split('###'))
+
+
+# the classifier settings of each data type
+CLASSIFIER_SETTINGS = {
+    'paloalto': {
+        'model_name': 'palo_alto',
+        'category_level': 5,
+        'language': 'english',
+        'loss': 'modified_huber'
+    },
+    'chile': {
+        'model_name': 'chile',
+        'category_level': 1,
+        'language': 'spanish',
+        'loss': 'log'
+    }
+}
+
+# the scores of the category levels
+LEVEL_SCORES = [1, 1, 0.5, 0.25, 0.25]
+
+# the names of the category levels, and the prefixes of the primary and secondary categories in the results
+CATEGORY_NAMES = ['main_category', 'subcategory1', 'subcategory2', 'subcategory3', 'subcategory4']
+CATEGORY_PREFIXES = ['primary_', 'secondary_']
+
+
+def create_classifier(data_type):
+    """
+    Creates the (unfitted) classifier of the data type, the feature mode is configured per data type.
+    :param data_type: the data type, paloalto or chile
+    :return: the classifier
+    """
+    settings = CLASSIFIER_SETTINGS[data_type]
+    features = get_config()['features'][data_type]
+    clf = CrowdClassifier(settings['category_level'], LEVEL_SCORES, settings['language'], settings['loss'],
+                          features['feature_mode'], features['n_features'])
+    clf.data_type = data_type
+    return clf
+
+
+def show_category(categories):
+    """
+    Converts the category names from array to readable name.
+    :param categories: the category arrays
+    :return: the category label
+    """
+    result = {}
+    for i, category_items in enumerate(categories):
+        prefix = CATEGORY_PREFIXES[i]
+        for idx, v in enumerate(category_items):
+            result[prefix + CATEGORY_NAMES[idx]] = v
+
+    return result
+
+
+def show_details(details):
+    """
+    Converts the predicted details from arrays to readable names.
+    :param details: the predicted details of a content, see CrowdClassifier.predict_details
+    :return: the category labels, the expected scores, and the top categories of each level with the probabilities
+    """
+    result = show_category(details['categories'])
+    result['primary_score'] = details['primary_score']
+    result['secondary_score'] = details['secondary_score']
+    top_categories = []
+    for level in details['levels']:
+        level_categories = []
+        for categories, probability in level:
+            item = dict(zip(CATEGORY_NAMES, categories))
+            item['probability'] = probability
+            level_categories.append(item)
+        top_categories.append(level_categories)
+    result['top_categories'] = top_categories
+    return result
+
+
+def load_classifier(data_type, models_dir, mmap=True, version=None):
+    """
+    Loads the trained classifier of the data type.
+    :param data_type: the data type, paloalto or chile
+    :param models_dir: the directory of the trained models
+    :param mmap: True to memory-map the weights read-only, False to load them for updating
+    :param version: the model version to load, None for the current version
+    :return: the classifier, its version is the model version
+    """
+    model_name = CLASSIFIER_SETTINGS[data_type]['model_name']
+    registry = ModelRegistry(models_dir)
+    if version is None:
+        version = registry.current_version(model_name)
+    clf = create_classifier(data_type)
+    clf.load(registry.get_model_filename(model_name, version), mmap)
+    clf.version = version
+    clf.exit_margin = get_config()['early_exit_margin']
+    return clf
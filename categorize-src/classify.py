@@ -0,0 +1,181 @@
+"""
+Copyright (C) 2016 TopCoder Inc., All Rights Reserved.
+
+It categorizes the documents of a data file offline, and writes the results to a csv or jsonl file.
+The interrupted run resumes from the last checkpoint.
+
+@author TCSCODER
+@version 1.0
+"""
+
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+
+from classifier import CATEGORY_NAMES, CATEGORY_PREFIXES, CLASSIFIER_SETTINGS, load_classifier, show_category
+from config import get_config, setup_logging
+from load_data import iter_rows
+from worker_pool import init_worker, predict_chunk
+
+# the columns of the csv output file
+CSV_COLUMNS = ['id', 'content'] + [prefix + name for prefix in CATEGORY_PREFIXES for name in CATEGORY_NAMES]
+
+
+def iter_documents(data_file):
+    """
+    Iterates the documents to categorize in the data file.
+    :param data_file: the data file name
+    :return: the generator of the documents, each document has the id and the content
+    """
+    for row in iter_rows(data_file):
+        if len(row) < 2:
+            break
+        doc_id = row[0]
+        if isinstance(doc_id, float) and doc_id.is_integer():
+            doc_id = '%d' % doc_id
+        yield {'id': doc_id, 'content': row[1]}
+
+
+def read_checkpoint(checkpoint_file):
+    """
+    Reads the checkpoint.
+    :param checkpoint_file: the checkpoint file name
+    :return: the checkpoint with the number of processed documents and the output file offset, None if not exists
+    """
+    if not os.path.isfile(checkpoint_file):
+        return None
+    with open(checkpoint_file, 'rt') as fd:
+        return json.load(fd)
+
+
+def write_checkpoint(checkpoint_file, processed, offset):
+    """
+    Writes the checkpoint, it is written to a temporary file first and then renamed.
+    :param checkpoint_file: the checkpoint file name
+    :param processed: the number of processed documents
+    :param offset: the offset of the output file after the processed documents
+    """
+    tmp_file = checkpoint_file + '.tmp'
+    with open(tmp_file, 'wt') as fd:
+        json.dump({'processed': processed, 'offset': offset}, fd)
+    os.rename(tmp_file, checkpoint_file)
+
+
+def write_results(fd, output_format, documents, predicted):
+    """
+    Writes the categorized documents to the output file.
+    :param fd: the output file
+    :param output_format: csv or jsonl
+    :param documents: the documents
+    :param predicted: the predicted categories of the documents
+    """
+    csv_writer = csv.writer(fd) if output_format == 'csv' else None
+    for doc, categories in zip(documents, predicted):
+        result = dict(doc)
+        result.update(show_category(categories))
+        if csv_writer:
+            row = []
+            for column in CSV_COLUMNS:
+                value = result.get(column)
+                if value is None:
+                    value = ''
+                elif isinstance(value, unicode):
+                    value = value.encode('utf-8')
+                row.append(value)
+            csv_writer.writerow(row)
+        else:
+            fd.write(json.dumps(result) + '\n')
+
+
+def main():
+    """
+    The main process
+    """
+    setup_logging()
+    appConfig = get_config()
+
+    # parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dataType', help='The data type, "paloalto" or "chile"')
+    parser.add_argument('dataFile', help='The data file to categorize, xlsx, csv or jsonl')
+    parser.add_argument('outputFile', help='The output file, csv or jsonl')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='The number of documents of a chunk')
+    parser.add_argument('--jobs', type=int, default=1, help='The number of processes to categorize the chunks')
+    args = parser.parse_args(sys.argv[1:])
+
+    # check file existence
+    if not os.path.isfile(args.dataFile):
+        print('The file does not exists: ' + args.dataFile)
+        sys.exit(-1)
+
+    if args.dataType not in CLASSIFIER_SETTINGS:
+        print('dataType can only be paloalto or chile')
+        sys.exit(-1)
+
+    output_format = 'jsonl' if args.outputFile.lower().endswith('.jsonl') else 'csv'
+    checkpoint_file = args.outputFile + '.checkpoint'
+    checkpoint = None
+    if os.path.isfile(args.outputFile):
+        checkpoint = read_checkpoint(checkpoint_file)
+
+    models_dir = appConfig['trained_models_dir']
+    pool = None
+    clf = None
+    if args.jobs > 1:
+        pool = multiprocessing.Pool(args.jobs, init_worker, (models_dir, [args.dataType]))
+    else:
+        clf = load_classifier(args.dataType, models_dir)
+
+    processed = 0
+    with open(args.outputFile, 'r+b' if checkpoint else 'wb') as fd:
+        if checkpoint:
+            # resume after the last checkpoint, the results written after it are discarded
+            processed = checkpoint['processed']
+            fd.seek(checkpoint['offset'])
+            fd.truncate()
+            print('Resume after %d categorized documents' % processed)
+        elif output_format == 'csv':
+            csv.writer(fd).writerow(CSV_COLUMNS)
+
+        documents = itertools.islice(iter_documents(args.dataFile), processed, None)
+        while True:
+            # read a chunk for each process, so only these chunks are in memory
+            chunks = []
+            for i in range(0, max(args.jobs, 1)):
+                chunk = list(itertools.islice(documents, args.chunk_size))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            if not chunks:
+                break
+
+            tasks = [(args.dataType, None, [doc['content'] for doc in chunk]) for chunk in chunks]
+            if pool:
+                results = pool.map(predict_chunk, tasks)
+            else:
+                results = [clf.predict(contents) for _, _, contents in tasks]
+
+            for chunk, predicted in zip(chunks, results):
+                write_results(fd, output_format, chunk, predicted)
+                processed += len(chunk)
+            fd.flush()
+            os.fsync(fd.fileno())
+            write_checkpoint(checkpoint_file, processed, fd.tell())
+            print('%d documents are categorized' % processed)
+
+    if pool:
+        pool.close()
+        pool.join()
+
+    # the run is completed
+    if os.path.isfile(checkpoint_file):
+        os.remove(checkpoint_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+Copyright (C) 2016 TopCoder Inc., All Rights Reserved.
+
+Loads the configuration, the configuration file is read on first use instead of at import time.
+
+@author TCSCODER
+@version 1.0
+"""
+
+import json
+import logging.config
+
+# the application configuration, loaded by get_config
+_app_config = None
+
+
+def get_config():
+    """
+    Gets the application configuration, it is loaded from conf/config.json on the first call.
+    :return: the configuration dictionary
+    """
+    global _app_config
+    if _app_config is None:
+        with open('conf/config.json', 'rt') as fd:
+            _app_config = json.load(fd)
+    return _app_config
+
+
+def setup_logging():
+    """
+    Setup the logging with conf/logging.json.
+    """
+    with open('conf/logging.json', 'rt') as fd:
+        logging.config.dictConfig(json.load(fd))
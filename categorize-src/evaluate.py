@@ -0,0 +1,137 @@
+"""
+Copyright (C) 2016 TopCoder Inc., All Rights Reserved.
+
+It evaluates the trained classifier offline with a test data file. The documents are predicted in process,
+and scored by the calculate_scores of the test harness, so the results are the same as the REST api scored by
+the test harness, without the HTTP round trips.
+
+@author TCSCODER
+@version 1.0
+"""
+
+
+import argparse
+import csv
+import os
+import sys
+import time
+
+from classifier import CLASSIFIER_SETTINGS, load_classifier, show_category
+from config import get_config, setup_logging
+from load_data import iter_rows
+
+# the directory of the test harness score.py
+DEFAULT_HARNESS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test-harness', 'test-harness')
+
+# the columns of the evaluation results, the accuracy columns are the same as the test harness
+CSV_COLUMNS = [
+    'dataType', 'model version', 'score', 'overall accuracy', 'main category accuracy', 'subcategory 1 accuracy',
+    'subcategory 2 accuracy', 'subcategory 3 accuracy', 'subcategory 4 accuracy', 'documents', 'load seconds',
+    'predict seconds', 'documents/s'
+]
+
+
+def iter_batches(data_file, batch_size):
+    """
+    Iterates the test documents of the data file in batches.
+    :param data_file: the data file name
+    :param batch_size: the number of documents of a batch
+    :return: the generator of the batches, each batch is a list of the expected documents
+    """
+    batch = []
+    for row in iter_rows(data_file):
+        row_len = len(row)
+        if row_len < 2:
+            break
+        doc_id = row[0]
+        if isinstance(doc_id, float) and doc_id.is_integer():
+            doc_id = '%d' % doc_id
+        expected_doc = {'id': doc_id, 'content': row[1]}
+        for idx, name in enumerate(['main_category', 'subcategory1', 'subcategory2', 'subcategory3', 'subcategory4']):
+            expected_doc[name] = row[idx + 2] if idx + 2 < row_len else None
+        batch.append(expected_doc)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    """
+    The main process
+    """
+    setup_logging()
+    appConfig = get_config()
+
+    # parse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dataType', help='The data type, "paloalto" or "chile"')
+    parser.add_argument('dataFile', help='The test data file, xlsx, csv or jsonl')
+    parser.add_argument('--batch-size', type=int, default=1000, help='The number of documents predicted at once')
+    parser.add_argument('--version', help='The model version to evaluate, the current version by default')
+    parser.add_argument('--output', help='The csv file to append the evaluation results')
+    parser.add_argument('--harness-dir', default=DEFAULT_HARNESS_DIR, help='The directory of the test harness score.py')
+    args = parser.parse_args(sys.argv[1:])
+
+    # check file existence
+    if not os.path.isfile(args.dataFile):
+        print('The file does not exists: ' + args.dataFile)
+        sys.exit(-1)
+
+    if args.dataType not in CLASSIFIER_SETTINGS:
+        print('dataType can only be paloalto or chile')
+        sys.exit(-1)
+
+    if not os.path.isfile(os.path.join(args.harness_dir, 'score.py')):
+        print('The test harness score.py does not exists in: ' + args.harness_dir)
+        sys.exit(-1)
+
+    # the scoring rules of the test harness
+    sys.path.insert(0, args.harness_dir)
+    import score
+
+    start_time = time.time()
+    clf = load_classifier(args.dataType, appConfig['trained_models_dir'], version=args.version)
+    load_seconds = time.time() - start_time
+
+    submission = score.Submission('offline', args.dataType, args.dataType == 'chile', 'in-process')
+    total_documents = 0
+    predict_seconds = 0.0
+    for batch in iter_batches(args.dataFile, args.batch_size):
+        start_time = time.time()
+        predicted = clf.predict([expected_doc['content'] for expected_doc in batch])
+        predict_seconds += time.time() - start_time
+
+        for expected_doc, categories in zip(batch, predicted):
+            expected_doc['normalized'] = score.normalize_expected_doc(expected_doc)
+            score.calculate_scores(submission, expected_doc, show_category(categories))
+        total_documents += len(batch)
+
+    if not total_documents:
+        print('There are no documents in the file: ' + args.dataFile)
+        sys.exit(-1)
+
+    # calculate actual accuracy, the same as the test harness
+    score.calculate_submission_accuracy(submission, total_documents)
+
+    row = [
+        args.dataType, clf.version, submission.score, submission.overallAccuracy, submission.mainCategoryAccuracy,
+        submission.subCategory1Accuracy, submission.subCategory2Accuracy, submission.subCategory3Accuracy,
+        submission.subCategory4Accuracy, total_documents, round(load_seconds, 3), round(predict_seconds, 3),
+        round(total_documents / predict_seconds, 1) if predict_seconds > 0 else None
+    ]
+    for name, value in zip(CSV_COLUMNS, row):
+        print('%-24s %s' % (name, value))
+
+    if args.output:
+        write_header = not os.path.isfile(args.output)
+        with open(args.output, 'ab') as fd:
+            writer = csv.writer(fd)
+            if write_header:
+                writer.writerow(CSV_COLUMNS)
+            writer.writerow(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,23 +7,22 @@ Load the pre-categorized data to memory
 @version 1.0
 """
 
+import csv
+import hashlib
+import itertools
 import json
-import logging.config
+import logging
+import os
 
+import numpy as np
 import pyexcel
 import pyexcel.ext.xls
 
-# setup logging
-with open('conf/logging.json', 'rt') as fd:
-    loggingConfig = json.load(fd)
+from config import get_config
+from model_file import read_model_file, write_model_file
 
-logging.config.dictConfig(loggingConfig)
 logger = logging.getLogger(__name__)
 
-# load configuration
-with open('conf/config.json', 'rt') as fd:
-    appConfig = json.load(fd)
-
 # the category names for normalization
 CATEGORY_NAME_MAPPINGS = {
     'bike lanes and pedestrain paths': 'Bike Lanes and Pedestrian Paths',
@@ -43,6 +42,15 @@ CATEGORY_NAME_MAPPINGS = {
     'students shuttles': 'student shuttles'
 }
 
+# the version of the normalization, increase it when normalize_category is changed to invalidate the dataset caches
+NORMALIZATION_VERSION = 1
+
+# the fields of the documents in the jsonl files, in the same order as the spreadsheet columns
+JSONL_FIELDS = ['id', 'content', 'main_category', 'subcategory1', 'subcategory2', 'subcategory3', 'subcategory4']
+
+# the extensions of the data files that are streamed, the other files are parsed whole by pyexcel
+STREAMED_EXTENSIONS = ['.csv', '.jsonl']
+
 
 def normalize_category(category, category_dict):
     """
@@ -84,25 +92,46 @@ def get_column_value(row, column_idx, row_len):
         return None
 
 
-def load_data(data_file):
+def iter_rows(data_file):
     """
-    Loads the data to memory.
-    :param data_file: the data file name.
-    :return: the document array
+    Iterates the data rows of the data file, the header row is skipped.
+    The csv and jsonl files are streamed, the xls/xlsx files are parsed by pyexcel first.
+    :param data_file: the data file name
+    :return: the generator of the rows, [id, content, main category, subcategory 1, ..., subcategory 4]
     """
+    extension = os.path.splitext(data_file)[1].lower()
+    if extension == '.jsonl':
+        with open(data_file, 'rt') as fd:
+            for line in fd:
+                if not line.strip():
+                    continue
+                doc = json.loads(line)
+                yield [doc.get(name) for name in JSONL_FIELDS]
+    elif extension == '.csv':
+        with open(data_file, 'rb') as fd:
+            reader = csv.reader(fd)
+            next(reader, None)
+            for row in reader:
+                yield [value.decode('utf-8') for value in row]
+    else:
+        sheet = pyexcel.get_sheet(file_name=data_file)
+        header_row = True
+        for row in sheet.row:
+            if header_row:
+                header_row = False
+                continue
+            yield row
 
-    sheet = pyexcel.get_sheet(file_name=data_file)
-    header_row = True
-    contents = []
 
+def iter_records(data_file):
+    """
+    Iterates the pre-categorized records of the data file.
+    :param data_file: the data file name
+    :return: the generator of the (content, categories) tuples
+    """
     category_dict = {}
-    categories_items = []
-
-    for row in sheet.row:
-        if header_row:
-            header_row = False
-            continue
 
+    for row in iter_rows(data_file):
         row_len = len(row)
         if row_len < 2:
             break
@@ -112,11 +141,135 @@ def load_data(data_file):
             category = normalize_category(get_column_value(row, i, row_len), category_dict)
             categories_item.append(category)
 
-        contents.append(row[1])
-        categories_items.append(categories_item)
+        yield row[1], categories_item
+
+
+def iter_chunks(data_file, chunk_size):
+    """
+    Iterates the pre-categorized records of the data file in chunks.
+    :param data_file: the data file name
+    :param chunk_size: the max number of records in a chunk
+    :return: the generator of the chunks, each chunk is in the same format as the result of load_data
+    """
+    records = iter_records(data_file)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            break
+        yield {
+            'data': [content for content, _ in chunk],
+            'categories': [categories_item for _, categories_item in chunk]
+        }
+
+
+def get_cache_filename(data_file):
+    """
+    Gets the dataset cache filename of the data file. It is keyed by the hash of the data file and the normalization,
+    so the cache is not used if any of them is changed.
+    :param data_file: the data file name
+    :return: the cache filename, None if the dataset cache is disabled
+    """
+    cache_dir = get_config().get('dataset_cache_dir')
+    if not cache_dir:
+        return None
+
+    key = hashlib.sha1()
+    with open(data_file, 'rb') as fd:
+        for block in iter(lambda: fd.read(1024 * 1024), b''):
+            key.update(block)
+    key.update(json.dumps([NORMALIZATION_VERSION, CATEGORY_NAME_MAPPINGS], sort_keys=True))
+    return os.path.join(cache_dir, '%s.%s.dataset' % (os.path.basename(data_file), key.hexdigest()))
+
+
+def write_dataset_cache(cache_filename, data):
+    """
+    Writes the loaded data to the dataset cache. The contents are saved as a UTF-8 blob with offsets,
+    and the categories are saved as integer codes of the category labels.
+    :param cache_filename: the cache filename
+    :param data: the loaded data
+    """
+    texts = []
+    offsets = [0]
+    for content in data['data']:
+        if not isinstance(content, unicode):
+            content = content.decode('utf-8') if isinstance(content, str) else unicode(content)
+        text = content.encode('utf-8')
+        texts.append(text)
+        offsets.append(offsets[-1] + len(text))
+
+    labels = []
+    label_codes = {}
+    codes = np.empty((len(data['categories']), 5), dtype=np.int32)
+    for i, categories_item in enumerate(data['categories']):
+        for j, category in enumerate(categories_item):
+            if category is None:
+                codes[i, j] = -1
+            else:
+                if category not in label_codes:
+                    label_codes[category] = len(labels)
+                    labels.append(category)
+                codes[i, j] = label_codes[category]
+
+    blob = b''.join(texts)
+    arrays = {
+        'texts': np.frombuffer(blob, dtype=np.uint8) if blob else np.zeros(0, dtype=np.uint8),
+        'offsets': np.array(offsets, dtype=np.int64),
+        'categories': codes
+    }
+    cache_dir = os.path.dirname(cache_filename)
+    if cache_dir and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    write_model_file(cache_filename, {'labels': labels}, arrays)
+
+
+def read_dataset_cache(cache_filename):
+    """
+    Reads the loaded data from the dataset cache.
+    :param cache_filename: the cache filename
+    :return: the loaded data, in the same format as load_data
+    """
+    header, arrays = read_model_file(cache_filename, mmap=False)
+    blob = arrays['texts'].tostring()
+    offsets = arrays['offsets'].tolist()
+    labels = header['labels']
+
+    contents = []
+    for i in range(0, len(offsets) - 1):
+        contents.append(blob[offsets[i]:offsets[i + 1]].decode('utf-8'))
+
+    categories_items = []
+    for codes in arrays['categories'].tolist():
+        categories_items.append([labels[code] if code >= 0 else None for code in codes])
 
     return {
         'data': contents,
         'categories': categories_items
     }
 
+
+def load_data(data_file, use_cache=True):
+    """
+    Loads the data to memory.
+    :param data_file: the data file name.
+    :param use_cache: True to load the data from the dataset cache, and to create the cache if not exists
+    :return: the document array
+    """
+    cache_filename = get_cache_filename(data_file) if use_cache else None
+    if cache_filename and os.path.isfile(cache_filename):
+        logger.info('Load the data from the dataset cache: %s', cache_filename)
+        return read_dataset_cache(cache_filename)
+
+    contents = []
+    categories_items = []
+
+    for content, categories_item in iter_records(data_file):
+        contents.append(content)
+        categories_items.append(categories_item)
+
+    data = {
+        'data': contents,
+        'categories': categories_items
+    }
+    if cache_filename:
+        write_dataset_cache(cache_filename, data)
+    return data
@@ -0,0 +1,178 @@
+"""
+Copyright (C) 2016 TopCoder Inc., All Rights Reserved.
+
+The counters and the histograms of the prediction stages, they are rendered in the Prometheus text format.
+
+@author TCSCODER
+@version 1.0
+"""
+
+import threading
+import time
+
+from contextlib import contextmanager
+
+# the histogram buckets of the stage durations in seconds
+TIME_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# the histogram buckets of the batch sizes
+SIZE_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+def format_labels(labels):
+    """
+    Formats the labels of a sample.
+    :param labels: the sorted (name, value) tuples of the labels
+    :return: the formatted labels, empty if there are no labels
+    """
+    if not labels:
+        return ''
+    values = []
+    for name, value in labels:
+        value = value if isinstance(value, basestring) else str(value)
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        values.append('%s="%s"' % (name, value))
+    return '{' + ','.join(values) + '}'
+
+
+def format_value(value):
+    """
+    Formats the value of a sample.
+    :param value: the value
+    :return: the formatted value
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    The thread-safe registry of the counters and the histograms, the recording is skipped when it is disabled.
+    """
+
+    def __init__(self):
+        """
+        Initialize the registry
+        """
+        self.enabled = True
+        self._descriptions = {}
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, metric_type, description, buckets=None):
+        """
+        Describes a metric, the metrics must be described before they are recorded.
+        :param name: the metric name
+        :param metric_type: counter, histogram or gauge
+        :param description: the help text
+        :param buckets: the upper bounds of the histogram buckets
+        """
+        self._descriptions[name] = (metric_type, description, buckets)
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increments a counter.
+        :param name: the metric name
+        :param value: the value to add
+        :param labels: the labels of the counter
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Observes a value of a histogram.
+        :param name: the metric name
+        :param value: the observed value
+        :param labels: the labels of the histogram
+        """
+        if not self.enabled:
+            return
+        buckets = self._descriptions[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes the seconds of the block.
+        :param name: the metric name
+        :param labels: the labels of the histogram
+        """
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start_time, **labels)
+
+    def histogram_sum(self, name, **labels):
+        """
+        Gets the sum of the observed values of a histogram.
+        :param name: the metric name
+        :param labels: the labels of the histogram
+        :return: the sum, 0 if no value is observed
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            return histogram['sum'] if histogram is not None else 0.0
+
+    def render(self, gauges=None):
+        """
+        Renders the metrics in the Prometheus text format.
+        :param gauges: the values kept by the other components, a dict of the metric name to the list of
+        (labels dict, value) tuples
+        :return: the metrics text
+        """
+        gauges = gauges or {}
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict((key, {'counts': list(value['counts']), 'sum': value['sum'], 'count': value['count']})
+                              for key, value in self._histograms.items())
+
+        lines = []
+        for name in sorted(self._descriptions):
+            metric_type, description, buckets = self._descriptions[name]
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, metric_type))
+            if metric_type == 'histogram':
+                for key in sorted(k for k in histograms if k[0] == name):
+                    histogram = histograms[key]
+                    for bound, count in zip(buckets + [float('inf')], histogram['counts'] + [histogram['count']]):
+                        labels = key[1] + (('le', format_value(bound)),)
+                        lines.append('%s_bucket%s %d' % (name, format_labels(labels), count))
+                    lines.append('%s_sum%s %s' % (name, format_labels(key[1]), format_value(histogram['sum'])))
+                    lines.append('%s_count%s %d' % (name, format_labels(key[1]), histogram['count']))
+                continue
+
+            for key in sorted(k for k in counters if k[0] == name):
+                lines.append('%s%s %s' % (name, format_labels(key[1]), format_value(counters[key])))
+            # the gauges, and the counters kept by the other components
+            for labels, value in gauges.get(name, []):
+                lines.append('%s%s %s' % (name, format_labels(tuple(sorted(labels.items()))), format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+# the registry of the metrics of this process
+registry = MetricsRegistry()
+registry.describe('crowd_stage_seconds', 'histogram', 'The seconds of each training and prediction stage.', TIME_BUCKETS)
+registry.describe('crowd_batch_size', 'histogram', 'The number of documents of each predicted batch.', SIZE_BUCKETS)
+registry.describe('crowd_documents_total', 'counter', 'The number of categorized documents.')
+registry.describe('crowd_requests_total', 'counter', 'The number of categorize requests.')
+registry.describe('crowd_cache_hits_total', 'counter', 'The number of cache hits.')
+registry.describe('crowd_cache_misses_total', 'counter', 'The number of cache misses.')
+registry.describe('crowd_cache_size', 'gauge', 'The number of cached entries.')
+registry.describe('crowd_model_info', 'gauge', 'The loaded model version of each data type.')
@@ -0,0 +1,113 @@
+"""
+Copyright (C) 2016 TopCoder Inc., All Rights Reserved.
+
+Coalesces the concurrent prediction requests into micro-batches, so they are predicted by one call.
+
+@author TCSCODER
+@version 1.0
+"""
+
+import logging
+import Queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PendingRequest:
+    """
+    The prediction request waiting in the micro-batch queue.
+    """
+
+    def __init__(self, contents):
+        """
+        Initialize the request
+        :param contents: the contents to predict
+        """
+        self.contents = contents
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    The micro-batcher of one data type. The requests are queued and predicted by a background thread,
+    a micro-batch is predicted when it has max_batch_size contents, or when its first request waited for max_wait.
+    """
+
+    def __init__(self, name, predict, max_batch_size, max_wait):
+        """
+        Initialize the micro-batcher and start its background thread
+        :param name: the name of the micro-batcher, used as the thread name
+        :param predict: the function to predict the contents of a micro-batch
+        :param max_batch_size: the max number of contents of a micro-batch
+        :param max_wait: the max time in seconds to wait for more requests
+        """
+        self.predict_batch = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = Queue.Queue()
+
+        thread = threading.Thread(target=self._run, name='micro-batcher-' + name)
+        thread.daemon = True
+        thread.start()
+
+    def predict(self, contents):
+        """
+        Predicts the contents in the next micro-batch, it blocks until the micro-batch is predicted.
+        :param contents: the contents to predict
+        :return: the predicted result (categories)
+        """
+        pending = PendingRequest(contents)
+        self._queue.put(pending)
+        # wait in a loop with timeout, so the waiting thread can still be interrupted
+        while not pending.done.wait(1):
+            pass
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _run(self):
+        """
+        Collects the queued requests into micro-batches and predicts them.
+        """
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0].contents)
+            deadline = time.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=timeout)
+                except Queue.Empty:
+                    break
+                batch.append(pending)
+                size += len(pending.contents)
+            self._predict(batch)
+
+    def _predict(self, batch):
+        """
+        Predicts a micro-batch and fans the results out to its requests.
+        :param batch: the requests of the micro-batch
+        """
+        contents = []
+        for pending in batch:
+            contents.extend(pending.contents)
+
+        try:
+            predicted = self.predict_batch(contents)
+            offset = 0
+            for pending in batch:
+                pending.result = predicted[offset:offset + len(pending.contents)]
+                offset += len(pending.contents)
+        except Exception as e:
+            logger.exception('Fail to predict the micro-batch of %d requests', len(batch))
+            for pending in batch:
+                pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
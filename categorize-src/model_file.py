@@ -0,0 +1,91 @@
+"""
+Copyright (C) 2016 TopCoder Inc., All Rights Reserved.
+
+Reads and writes the model file. The model file is a single file with a JSON header followed by raw arrays,
+so the arrays can be memory-mapped read-only and shared by the processes on the same host.
+The same format is used by the dataset caches of load_data.
+
+@author TCSCODER
+@version 1.0
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+# the magic bytes at the beginning of the model file
+MAGIC = b'CROWDMD1'
+
+# the alignment of the header and the arrays in bytes
+ALIGNMENT = 64
+
+
+def _align(offset):
+    """
+    Rounds up the offset to the alignment.
+    :param offset: the offset
+    :return: the aligned offset
+    """
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_model_file(filename, header, arrays):
+    """
+    Writes the model file. The file is written to a temporary file first, and then renamed.
+    :param filename: the model filename
+    :param header: the header dictionary, it must be JSON serializable
+    :param arrays: the dictionary of the numpy arrays
+    """
+    arrays = dict((name, np.ascontiguousarray(array)) for name, array in arrays.items())
+
+    header = dict(header)
+    header['arrays'] = {}
+    offset = 0
+    for name in sorted(arrays):
+        array = arrays[name]
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += _align(array.nbytes)
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_offset = _align(len(MAGIC) + 8 + len(header_bytes))
+
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb') as fd:
+        fd.write(MAGIC)
+        fd.write(struct.pack('<Q', len(header_bytes)))
+        fd.write(header_bytes)
+        for name in sorted(arrays):
+            fd.seek(data_offset + header['arrays'][name]['offset'])
+            fd.write(arrays[name].tostring())
+        fd.truncate(data_offset + offset)
+    os.rename(tmp_filename, filename)
+
+
+def read_model_file(filename, mmap=True):
+    """
+    Reads the model file.
+    :param filename: the model filename
+    :param mmap: True to memory-map the arrays read-only, False to read them to writable memory
+    :return: the header dictionary and the dictionary of the arrays
+    """
+    with open(filename, 'rb') as fd:
+        if fd.read(len(MAGIC)) != MAGIC:
+            raise ValueError('The file is not a model file: ' + filename)
+        header_length = struct.unpack('<Q', fd.read(8))[0]
+        header = json.loads(fd.read(header_length).decode('utf-8'))
+    data_offset = _align(len(MAGIC) + 8 + header_length)
+
+    if mmap:
+        data = np.memmap(filename, dtype=np.uint8, mode='r')
+    else:
+        data = np.fromfile(filename, dtype=np.uint8)
+
+    arrays = {}
+    for name, info in header.pop('arrays').items():
+        dtype = np.dtype(info['dtype'])
+        start = data_offset + info['offset']
+        count = int(np.prod(info['shape']))
+        arrays[name] = data[start:start + count * dtype.itemsize].view(dtype).reshape(info['shape'])
+    return header, arrays
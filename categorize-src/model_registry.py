@@ -0,0 +1,100 @@
+"""
+Copyright (C) 2016 TopCoder Inc., All Rights Reserved.
+
+The registry of the trained model versions. Each model has a directory in the trained models directory,
+each version of the model has a sub directory, and the CURRENT file names the version in use:
+
+    trained_models/palo_alto/CURRENT
+    trained_models/palo_alto/20161018103000/palo_alto.model
+
+@author TCSCODER
+@version 1.0
+"""
+
+import datetime
+import os
+
+# the file naming the current version of a model
+CURRENT_FILENAME = 'CURRENT'
+
+
+class ModelRegistry:
+    """
+    The registry of the model versions in the trained models directory.
+    """
+
+    def __init__(self, models_dir):
+        """
+        Initialize the registry
+        :param models_dir: the directory of the trained models
+        """
+        self.models_dir = models_dir
+
+    def list_versions(self, model_name):
+        """
+        Lists the versions of the model.
+        :param model_name: the model name
+        :return: the sorted versions, the latest version is the last
+        """
+        model_dir = os.path.join(self.models_dir, model_name)
+        if not os.path.isdir(model_dir):
+            return []
+        versions = []
+        for version in os.listdir(model_dir):
+            if os.path.isfile(self.get_model_filename(model_name, version) + '.model'):
+                versions.append(version)
+        return sorted(versions)
+
+    def current_version(self, model_name):
+        """
+        Gets the current version of the model, it is the version in the CURRENT file, or the latest version.
+        :param model_name: the model name
+        :return: the current version, None if the model has no version
+        """
+        current_file = os.path.join(self.models_dir, model_name, CURRENT_FILENAME)
+        if os.path.isfile(current_file):
+            with open(current_file, 'rt') as fd:
+                version = fd.read().strip()
+            if version:
+                return version
+        versions = self.list_versions(model_name)
+        return versions[-1] if versions else None
+
+    def get_model_filename(self, model_name, version=None):
+        """
+        Gets the model filename of a version, without the '.model' extension.
+        :param model_name: the model name
+        :param version: the version, None for the current version
+        :return: the model filename
+        """
+        if version is None:
+            version = self.current_version(model_name)
+            if version is None:
+                raise IOError('There is no trained version of the model: ' + model_name)
+        return os.path.join(self.models_dir, model_name, version, model_name)
+
+    def create_version(self, model_name):
+        """
+        Creates the directory of a new version. The new version is not current until set_current is called.
+        :param model_name: the model name
+        :return: the new version
+        """
+        base_version = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+        version = base_version
+        suffix = 0
+        while os.path.exists(os.path.join(self.models_dir, model_name, version)):
+            suffix += 1
+            version = '%s-%d' % (base_version, suffix)
+        os.makedirs(os.path.join(self.models_dir, model_name, version))
+        return version
+
+    def set_current(self, model_name, version):
+        """
+        Sets the current version of the model, the CURRENT file is replaced atomically.
+        :param model_name: the model name
+        :param version: the version
+        """
+        current_file = os.path.join(self.models_dir, model_name, CURRENT_FILENAME)
+        with open(current_file + '.tmp', 'wt') as fd:
+            fd.write(version + '\n')
+        os.rename(current_file + '.tmp', current_file)
@@ -0,0 +1,123 @@
+"""
+Copyright (C) 2016 TopCoder Inc., All Rights Reserved.
+
+The cache of the predicted categories, it is keyed by the data type, the model version and the content hash.
+
+@author TCSCODER
+@version 1.0
+"""
+
+import hashlib
+import threading
+import time
+
+from collections import OrderedDict
+
+
+def content_hash(content):
+    """
+    Gets the hash of the normalized content, the case and the whitespaces are ignored.
+    :param content: the content
+    :return: the hash string
+    """
+    normalized = ' '.join(content.split()).lower()
+    if not isinstance(normalized, str):
+        normalized = normalized.encode('utf-8')
+    return hashlib.sha1(normalized).hexdigest()
+
+
+class PredictionCache:
+    """
+    The bounded LRU cache of the predicted categories, the entries expire after the ttl.
+    """
+
+    def __init__(self, max_size, ttl):
+        """
+        Initialize the cache
+        :param max_size: the max number of cached contents, 0 to disable the cache
+        :param ttl: the time to live of the entries in seconds, 0 for no expiration
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def predict(self, data_type, classifier, contents, predict=None):
+        """
+        Predicts the contents, only the contents not in the cache are predicted by the classifier.
+        :param data_type: the data type
+        :param classifier: the classifier of the data type
+        :param contents: the contents to predict
+        :param predict: the function to predict the missed contents, classifier.predict by default
+        :return: the predicted result (categories)
+        """
+        if predict is None:
+            predict = classifier.predict
+        if self.max_size <= 0:
+            return predict(contents)
+
+        version = classifier.version
+        keys = [(data_type, version, content_hash(content)) for content in contents]
+        result = [None] * len(contents)
+
+        # the indexes of the missed contents, grouped by the key
+        missed = OrderedDict()
+        now = time.time()
+        with self._lock:
+            if self._versions.get(data_type) != version:
+                self._invalidate(data_type)
+                self._versions[data_type] = version
+            for i, key in enumerate(keys):
+                entry = self._cache.pop(key, None)
+                if entry is not None and (not self.ttl or entry[0] > now):
+                    self._cache[key] = entry
+                    result[i] = entry[1]
+                    self.hits += 1
+                else:
+                    missed.setdefault(key, []).append(i)
+                    self.misses += 1
+
+        if missed:
+            predicted = predict([contents[indexes[0]] for indexes in missed.values()])
+            with self._lock:
+                for (key, indexes), categories in zip(missed.items(), predicted):
+                    for i in indexes:
+                        result[i] = categories
+                    self._cache[key] = (now + self.ttl, categories)
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+        return result
+
+    def clear(self):
+        """
+        Removes all the cached entries.
+        """
+        with self._lock:
+            self._cache.clear()
+            self._versions.clear()
+
+    def stats(self):
+        """
+        Gets the statistics of the cache.
+        :return: the statistics dictionary
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / total if total else 0.0,
+            'size': len(self._cache),
+            'max_size': self.max_size,
+            'ttl': self.ttl
+        }
+
+    def _invalidate(self, data_type):
+        """
+        Removes the cached entries of the data type, the lock must be held.
+        :param data_type: the data type
+        """
+        for key in [key for key in self._cache if key[0] == data_type]:
+            del self._cache[key]
@@ -9,26 +9,40 @@ It trains the text documents.
 
 
 import argparse
-import json
 import os
 import sys
 
-from classifier import CrowdClassifier
-from load_data import load_data
-
-# load configuration
-with open('conf/config.json', 'rt') as fd:
-    appConfig = json.load(fd)
+from classifier import CLASSIFIER_SETTINGS, create_classifier, load_classifier
+from config import get_config, setup_logging
+from load_data import STREAMED_EXTENSIONS, iter_chunks, load_data
+from model_registry import ModelRegistry
 
 
 def main():
     """
     The main process
     """
+    setup_logging()
+    appConfig = get_config()
+
     # parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument('dataType', help='The data type, "paloalto" or "chile"')
     parser.add_argument('dataFile', help='The data file to train')
+    parser.add_argument('--jobs', type=int, default=1, help='The number of processes to train the levels in parallel')
+    parser.add_argument('--update', action='store_true',
+                        help='Update the trained model with the data file instead of training a new model')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help='The mini-batch size to update the trained model, or to train with --stream')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream the data file in mini-batches to train, only for the hashing feature mode')
+    parser.add_argument('--epochs', type=int, default=10, help='The number of passes over the data file with --stream')
+    parser.add_argument('--no-cache', action='store_true', help='Parse the data file instead of using the dataset cache')
+    parser.add_argument('--compact', type=float, metavar='THRESHOLD',
+                        help='Prune the weights less than the threshold in absolute value, and store the weights '
+                             'as float32 sparse matrices')
+    parser.add_argument('--eval-file', help='The data file to report the score change of --compact, '
+                                            'the data file to train by default')
     args = parser.parse_args(sys.argv[1:])
 
     # check file existence
@@ -36,20 +50,44 @@ def main():
         print('The file does not exists: ' + args.dataFile)
         sys.exit(-1)
 
-    if args.dataType == 'paloalto':
-        palo_alto_data = load_data(args.dataFile)
-        palo_alto_clf = CrowdClassifier(5, [1, 1, 0.5, 0.25, 0.25], 'english', 'modified_huber')
-        palo_alto_clf = palo_alto_clf.fit(palo_alto_data['data'], palo_alto_data['categories'])
-        palo_alto_clf.dump(os.path.join(appConfig['trained_models_dir'], 'palo_alto'))
-    elif args.dataType == 'chile':
-        chile_data = load_data(args.dataFile)
-        chile_clf = CrowdClassifier(1, [1, 1, 0.5, 0.25, 0.25], 'spanish', 'log')
-        chile_clf = chile_clf.fit(chile_data['data'], chile_data['categories'])
-        chile_clf.dump(os.path.join(appConfig['trained_models_dir'], 'chile'))
-    else:
+    if args.dataType not in CLASSIFIER_SETTINGS:
         print('dataType can only be paloalto or chile')
         sys.exit(-1)
 
+    if args.update:
+        clf = load_classifier(args.dataType, appConfig['trained_models_dir'], mmap=False)
+        for chunk in iter_chunks(args.dataFile, args.batch_size):
+            clf.partial_fit(chunk['data'], chunk['categories'])
+    elif args.stream:
+        if os.path.splitext(args.dataFile)[1].lower() not in STREAMED_EXTENSIONS:
+            print('--stream can only be used with the csv or jsonl files, convert the data file to csv or jsonl')
+            sys.exit(-1)
+        clf = create_classifier(args.dataType)
+        if clf.feature_mode != 'hashing':
+            print('--stream can only be used with the hashing feature mode')
+            sys.exit(-1)
+        clf = clf.fit_stream(lambda: iter_chunks(args.dataFile, args.batch_size), n_epochs=args.epochs)
+    else:
+        data = load_data(args.dataFile, use_cache=not args.no_cache)
+        clf = create_classifier(args.dataType)
+        clf = clf.fit(data['data'], data['categories'], n_jobs=args.jobs)
+
+    if args.compact is not None:
+        eval_data = load_data(args.eval_file or args.dataFile, use_cache=not args.no_cache)
+        score = clf.score(clf.predict(eval_data['data']), eval_data['categories'])
+        kept, total = clf.compact(args.compact)
+        compact_score = clf.score(clf.predict(eval_data['data']), eval_data['categories'])
+        print('The weights are compacted to %d of %d (%.2f%%), the score is changed from %.4f to %.4f'
+              % (kept, total, 100.0 * kept / max(total, 1), score, compact_score))
+
+    # save the model as a new version, and make it current
+    registry = ModelRegistry(appConfig['trained_models_dir'])
+    model_name = CLASSIFIER_SETTINGS[args.dataType]['model_name']
+    version = registry.create_version(model_name)
+    clf.dump(registry.get_model_filename(model_name, version))
+    registry.set_current(model_name, version)
+    print('The model version %s of %s is saved' % (version, args.dataType))
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,99 @@
+"""
+Copyright (C) 2016 TopCoder Inc., All Rights Reserved.
+
+The process pool to predict the large batches of contents in parallel.
+
+@author TCSCODER
+@version 1.0
+"""
+
+import logging
+import multiprocessing
+
+from classifier import load_classifier
+
+logger = logging.getLogger(__name__)
+
+# the classifiers loaded in the worker process, and the directory to load them
+worker_classifiers = {}
+worker_models_dir = None
+
+
+def init_worker(models_dir, data_types):
+    """
+    Loads the classifiers once when the worker process starts, the other data types are loaded on first use.
+    The load errors are only logged, because the pool respawns the worker forever if the initializer raises,
+    the classifiers failed to load are loaded again by predict_chunk.
+    :param models_dir: the directory of the trained models
+    :param data_types: the data types to load
+    """
+    global worker_models_dir
+    worker_models_dir = models_dir
+    for data_type in data_types:
+        try:
+            worker_classifiers[data_type] = load_classifier(data_type, models_dir)
+        except Exception:
+            logger.exception('Fail to load the %s classifier in the worker process', data_type)
+
+
+def predict_chunk(task):
+    """
+    Predicts a chunk of contents in the worker process.
+    :param task: the (data type, model version, contents) tuple, the model version is None for any loaded version
+    :return: the predicted result (categories)
+    """
+    data_type, version, contents = task
+    clf = worker_classifiers.get(data_type)
+    if clf is None or (version is not None and clf.version != version):
+        # the model is reloaded if the parent process has swapped in another version
+        clf = load_classifier(data_type, worker_models_dir, version=version)
+        worker_classifiers[data_type] = clf
+    return clf.predict(contents)
+
+
+class PredictionPool:
+    """
+    The pool of worker processes, the large batches are split into chunks and predicted in parallel.
+    """
+
+    def __init__(self, models_dir, data_types, processes, min_chunk_size):
+        """
+        Initialize the pool, the classifiers are loaded in each worker process.
+        :param models_dir: the directory of the trained models
+        :param data_types: the data types to load when the worker processes start
+        :param processes: the number of worker processes
+        :param min_chunk_size: the min number of contents of a chunk
+        """
+        self.processes = processes
+        self.min_chunk_size = max(min_chunk_size, 1)
+        self._pool = multiprocessing.Pool(processes, init_worker, (models_dir, data_types))
+
+    def predict(self, data_type, classifier, contents):
+        """
+        Predicts the contents. The small batches are predicted by the given classifier in the current process.
+        :param data_type: the data type
+        :param classifier: the classifier to use for the small batches
+        :param contents: the contents to predict
+        :return: the predicted result (categories)
+        """
+        chunks = min(self.processes, len(contents) // self.min_chunk_size)
+        if chunks < 2:
+            return classifier.predict(contents)
+
+        chunk_size = (len(contents) + chunks - 1) // chunks
+        tasks = []
+        for i in range(0, len(contents), chunk_size):
+            tasks.append((data_type, classifier.version, contents[i:i + chunk_size]))
+
+        # the chunks are returned in order
+        result = []
+        for predicted in self._pool.map(predict_chunk, tasks):
+            result.extend(predicted)
+        return result
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        self._pool.close()
+        self._pool.join()
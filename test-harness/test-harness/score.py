@@ -7,12 +7,14 @@ It will score the user submissions with the input data.
 @version 1.0
 """
 
-import sys, argparse, csv, json, re
+import sys, argparse, csv, json, re, itertools, math, threading, time
 import logging, logging.config
 import pyexcel
 import pyexcel.ext.xls
 import requests
+import requests.adapters
 import concurrent.futures
+from collections import OrderedDict
 from recordtype import recordtype
 
 # user submission record type
@@ -20,9 +22,41 @@ Submission = recordtype('Submission', [
     'submissionId', 'dataType', 'single', 'endpoint', ('score', 0), 
     ('overallAccuracy', 0), ('mainCategoryAccuracy', 0), 
     ('subCategory1Accuracy', 0), ('subCategory2Accuracy', 0), 
-    ('subCategory3Accuracy', 0), ('subCategory4Accuracy', 0)
+    ('subCategory3Accuracy', 0), ('subCategory4Accuracy', 0), ('loadResults', None)
 ])
 
+# load test record type, the requests are sent at the target rate if given, back to back by the concurrent threads otherwise
+LoadTest = recordtype('LoadTest', ['batchSizes', 'duration', 'concurrency', 'rate'])
+
+# the latency percentiles of the load test
+LOAD_TEST_PERCENTILES = [50, 95, 99]
+
+# the category columns of each level, the scores of each level, and the accuracy fields of each level
+CATEGORY_COLUMNS = ['main_category', 'subcategory1', 'subcategory2', 'subcategory3', 'subcategory4']
+LEVEL_SCORES = [1.0, 1.0, 0.5, 0.25, 0.25]
+ACCURACY_FIELDS = [
+    'mainCategoryAccuracy', 'subCategory1Accuracy', 'subCategory2Accuracy', 'subCategory3Accuracy',
+    'subCategory4Accuracy'
+]
+
+# the typo words to fix, and the compiled patterns to normalize the values
+TYPO_WORDS = {
+    'pedestrain': 'pedestrian',
+    'pedestrian': 'pedestrian',
+    'shttles': 'shuttles',
+    'shttle': 'shuttle',
+    'priavte': 'private'
+}
+TYPO_PATTERN = re.compile(r'\b(%s)\b' % '|'.join(sorted(TYPO_WORDS, key=len, reverse=True)))
+PLURAL_SPACE_PATTERN = re.compile(r's\s+')
+PLURAL_END_PATTERN = re.compile(r's$')
+NON_ALPHANUMERIC_PATTERN = re.compile(r'[^a-zA-Z0-9]')
+
+# the memo of the normalized values, the least recently used values are evicted
+NORMALIZED_CACHE_SIZE = 10000
+normalizedCache = OrderedDict()
+normalizedCacheLock = threading.Lock()
+
 
 # setup logging
 with open('conf/logging.json', 'rt') as fd:
@@ -56,28 +90,64 @@ def normalize_value(value):
     '''
     if value is None:
         return None
+
+    with normalizedCacheLock:
+        if value in normalizedCache:
+            result = normalizedCache.pop(value)
+            normalizedCache[value] = result
+            return result
+
     result = value.lower()
     # fix typo
-    typo_words = {
-        'pedestrain': 'pedestrian',
-        'pedestrian': 'pedestrian',
-        'shttles': 'shuttles',
-        'shttle': 'shuttle',
-        'priavte': 'private'
-    }
-    for typo, word in typo_words.iteritems():
-        result = re.sub(r'\b%s\b' % typo, word, result)
-    result = re.sub(r's\s+', '', result)
-    result = re.sub(r's$', '', result)
-    result = re.sub(r'\s+', '', result)
-    result = result.replace('\n', '').replace('\r', '')
-    result = re.sub(r'[^a-zA-Z0-9]', '', result)
-    result = result.replace('-', '')
+    result = TYPO_PATTERN.sub(lambda match: TYPO_WORDS[match.group(1)], result)
+    # remove the plural suffixes in the original order, the "s" left at the end by the first pattern is removed too
+    result = PLURAL_SPACE_PATTERN.sub('', result)
+    result = PLURAL_END_PATTERN.sub('', result)
+    # remove all the whitespaces, dashes and other symbols
+    result = NON_ALPHANUMERIC_PATTERN.sub('', result)
     if not result:
-        return None
+        result = None
+
+    with normalizedCacheLock:
+        normalizedCache[value] = result
+        if len(normalizedCache) > NORMALIZED_CACHE_SIZE:
+            normalizedCache.popitem(last=False)
     return result
 
 
+def normalize_expected_doc(expectedDoc):
+    '''
+    Normalize the expected categories of the document, it is done once when the expected document is loaded.
+    Args:
+        expectedDoc: the expected document
+    Returns:
+        the normalized expected categories of each level
+    '''
+    normalizedValues = []
+    for column in CATEGORY_COLUMNS:
+        expectedValue = expectedDoc.get(column)
+        normalizedValues.append(normalize_value(expectedValue if expectedValue is not None else ""))
+    return normalizedValues
+
+
+def is_normalized_value_equal(normalizedExpectedValue, userValue):
+    '''
+    Check the normalized expected value and the user value are equal or not.
+    Args:
+        normalizedExpectedValue: the normalized expected value
+        userValue: the user value to check
+    Returns:
+        True if the normalized user value is equal to the normalized expected value, False otherwise
+    '''
+    if userValue is None:
+        userValue = ""
+
+    if not isinstance(userValue, basestring):
+        return False
+    else:
+        return normalizedExpectedValue == normalize_value(userValue)
+
+
 def is_value_equal(expectedValue, userValue):
     '''
     Check the two given values are equal or not.
@@ -90,91 +160,64 @@ def is_value_equal(expectedValue, userValue):
     if expectedValue is None:
         expectedValue = ""
 
-    if userValue is None:
-        userValue = ""
-
-    if not isinstance(userValue, basestring):
-        return False
-    else:
-        return normalize_value(expectedValue) == normalize_value(userValue)
+    return is_normalized_value_equal(normalize_value(expectedValue), userValue)
 
 def calculate_scores(submission, expectedDoc, categorizedDoc):
     '''
     Calculate the scores by comparing the categorized document from user and the expected document
     Args:
         submission: the user submission data
-        expectedDoc: the expected document
+        expectedDoc: the expected document, with the normalized categories if they are normalized when loaded
         categorizedDoc: the categorized document from user
     '''
-    primaryMainCategoryEqual = is_value_equal(expectedDoc.get('main_category'), categorizedDoc.get('primary_main_category'))
-    secondaryMainCategoryEqual = is_value_equal(expectedDoc.get('main_category'), categorizedDoc.get('secondary_main_category'))
-
-    if not submission.single:
-        primarySubCategory1Equal = is_value_equal(expectedDoc.get('subcategory1'), categorizedDoc.get('primary_subcategory1'))
-        primarySubCategory2Equal = is_value_equal(expectedDoc.get('subcategory2'), categorizedDoc.get('primary_subcategory2'))
-        primarySubCategory3Equal = is_value_equal(expectedDoc.get('subcategory3'), categorizedDoc.get('primary_subcategory3'))
-        primarySubCategory4Equal = is_value_equal(expectedDoc.get('subcategory4'), categorizedDoc.get('primary_subcategory4'))
-        
-        secondarySubCategory1Equal = is_value_equal(expectedDoc.get('subcategory1'), categorizedDoc.get('secondary_subcategory1'))
-        secondarySubCategory2Equal = is_value_equal(expectedDoc.get('subcategory2'), categorizedDoc.get('secondary_subcategory2'))
-        secondarySubCategory3Equal = is_value_equal(expectedDoc.get('subcategory3'), categorizedDoc.get('secondary_subcategory3'))
-        secondarySubCategory4Equal = is_value_equal(expectedDoc.get('subcategory4'), categorizedDoc.get('secondary_subcategory4'))
+    normalizedValues = expectedDoc.get('normalized')
+    if normalizedValues is None:
+        normalizedValues = normalize_expected_doc(expectedDoc)
 
+    # the secondary category scores half of the level score if the primary category is not equal
     score = 0.0
-    if primaryMainCategoryEqual:  
-        score += 1.0
-
-    if not primaryMainCategoryEqual and secondaryMainCategoryEqual:
-        score += 0.5
-
-    if not submission.single:
-        if primarySubCategory1Equal:
-            score += 1.0
-        if primarySubCategory2Equal:
-            score += 0.5
-        if primarySubCategory3Equal: 
-            score += 0.25
-        if primarySubCategory4Equal:
-            score += 0.25
-        
-        if not primarySubCategory1Equal and secondarySubCategory1Equal:
-            score += 0.5
-        if not primarySubCategory2Equal and secondarySubCategory2Equal:
-            score += 0.25
-        if not primarySubCategory3Equal and secondarySubCategory3Equal:
-            score += 0.125
-        if not primarySubCategory4Equal and secondarySubCategory4Equal:
-            score += 0.125
+    levels = 1 if submission.single else len(CATEGORY_COLUMNS)
+    for level in range(0, levels):
+        column = CATEGORY_COLUMNS[level]
+        primaryEqual = is_normalized_value_equal(normalizedValues[level], categorizedDoc.get('primary_' + column))
+        if primaryEqual:
+            score += LEVEL_SCORES[level]
+            setattr(submission, ACCURACY_FIELDS[level], getattr(submission, ACCURACY_FIELDS[level]) + 1)
+            submission.overallAccuracy += 1
+        elif is_normalized_value_equal(normalizedValues[level], categorizedDoc.get('secondary_' + column)):
+            score += 0.5 * LEVEL_SCORES[level]
 
     submission.score += score
-    submission.mainCategoryAccuracy += int(primaryMainCategoryEqual)
-    submission.overallAccuracy += int(primaryMainCategoryEqual)
-
-    if not submission.single:
-        submission.subCategory1Accuracy += int(primarySubCategory1Equal)
-        submission.overallAccuracy += int(primarySubCategory1Equal)
-
-        submission.subCategory2Accuracy += int(primarySubCategory2Equal)
-        submission.overallAccuracy += int(primarySubCategory2Equal)
+    
 
-        submission.subCategory3Accuracy += int(primarySubCategory3Equal)
-        submission.overallAccuracy += int(primarySubCategory3Equal)
+def create_session(batchConcurrency):
+    '''
+    Create the session to send the batches to a submission api endpoint, the connections are kept alive and reused.
+    Args:
+        batchConcurrency: the number of batches sent concurrently
+    Returns:
+        the session
+    '''
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=batchConcurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
-        submission.subCategory4Accuracy += int(primarySubCategory4Equal)
-        submission.overallAccuracy += int(primarySubCategory4Equal)
-    
 
-def process_with_batch_data(submission, postedDocBatch, expectedDocBatch, batchNo, totalBatches, requestTimeout, logger):
+def process_with_batch_data(session, submission, postedDocBatch, batchNo, totalBatches, requestTimeout, logger):
     '''
     Send one batch of documents to the submission api endpoint, and verify the results. 
     Args:
+        session: the session to send the request
         submission: the submission data
         postedDocBatch: a batch of documents to post
-        expectedDocBatch: the expected results
         batchNo: the batch number
         totalBatches: the total number of batches
         requestTimeout: the timeout to to receive response from submission's REST api endpoint
         logger: the logger
+    Returns:
+        the dictionary of the categorized documents by id, None if the response is invalid
     '''
     payload = { 'document':  postedDocBatch }
 
@@ -182,7 +225,7 @@ def process_with_batch_data(submission, postedDocBatch, expectedDocBatch, batchN
     endpoint = submission.endpoint
     logger.info('Start to send batch %s/%s data request to %s', batchNo, totalBatches, endpoint)    
     try:
-        response = requests.post(endpoint, json=payload, timeout=requestTimeout)
+        response = session.post(endpoint, json=payload, timeout=requestTimeout)
 
         logger.debug('The response status code for batch %s/%s request is: %s', batchNo, totalBatches, response.status_code)
         logger.debug('The response data for batch %s/%s request is as below:\n%s', batchNo, totalBatches, response.text)
@@ -213,14 +256,7 @@ def process_with_batch_data(submission, postedDocBatch, expectedDocBatch, batchN
         docId = doc.get('id')
         if docId is not None:
             categorizedDocMap[docId] = doc
-
-    # calculate the scores
-    for expectedDoc in expectedDocBatch:
-        docId = expectedDoc.get('id')
-
-        categorizedDoc = categorizedDocMap.get(docId)
-        if categorizedDoc is not None:
-            calculate_scores(submission, expectedDoc, categorizedDoc)
+    return categorizedDocMap
 
 
 def calculate_accuracy(value, total):
@@ -236,8 +272,27 @@ def calculate_accuracy(value, total):
     return numberFormat % (round(value * 100.0 / total, 2))
 
 
+def calculate_submission_accuracy(submission, totalDocuments):
+    '''
+    Calculate the actual accuracy of the submission from the accuracy counts.
+    Args:
+        submission: the submission data, with the accuracy counts calculated by calculate_scores
+        totalDocuments: the total number of documents
+    '''
+    submission.mainCategoryAccuracy = calculate_accuracy(submission.mainCategoryAccuracy, totalDocuments)
+    submission.subCategory1Accuracy = calculate_accuracy(submission.subCategory1Accuracy, totalDocuments)
+    submission.subCategory2Accuracy = calculate_accuracy(submission.subCategory2Accuracy, totalDocuments)
+    submission.subCategory3Accuracy = calculate_accuracy(submission.subCategory3Accuracy, totalDocuments)
+    submission.subCategory4Accuracy = calculate_accuracy(submission.subCategory4Accuracy, totalDocuments)    
+
+    if not submission.single:        
+        submission.overallAccuracy = calculate_accuracy(submission.overallAccuracy, totalDocuments * 5)
+    else:
+        submission.overallAccuracy = submission.mainCategoryAccuracy        
+
 
-def process_submission(submission, postedDocBatches, expectedDocBatches, totalDocuments, totalBatches, requestTimeout):
+def process_submission(submission, postedDocBatches, expectedDocBatches, totalDocuments, totalBatches, requestTimeout,
+                       batchConcurrency):
     '''
     Process the submission to calculate the scores. 
     Args:
@@ -247,28 +302,158 @@ def process_submission(submission, postedDocBatches, expectedDocBatches, totalDo
         totalDocuments: the total number of documents
         totalBatches: the total number of batches
         requestTimeout: the timeout to to receive response from submission's REST api endpoint
+        batchConcurrency: the number of batches sent concurrently to the submission api endpoint
     '''
     logger = logging.getLogger('submission-' + submission.submissionId)
 
-    # calculate scores
-    for idx, postedDocBatch in enumerate(postedDocBatches):
-        process_with_batch_data(submission, postedDocBatch, expectedDocBatches[idx], idx + 1, totalBatches, requestTimeout, logger)
+    # send the batches concurrently, the scores are calculated in this thread as the responses arrive
+    session = create_session(batchConcurrency)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=batchConcurrency) as executor:
+        futures = {}
+        for idx, postedDocBatch in enumerate(postedDocBatches):
+            future = executor.submit(process_with_batch_data, session, submission, postedDocBatch, idx + 1, totalBatches, requestTimeout, logger)
+            futures[future] = idx
 
-    # calculate actual accuracy
-    submission.mainCategoryAccuracy = calculate_accuracy(submission.mainCategoryAccuracy, totalDocuments)
-    submission.subCategory1Accuracy = calculate_accuracy(submission.subCategory1Accuracy, totalDocuments)
-    submission.subCategory2Accuracy = calculate_accuracy(submission.subCategory2Accuracy, totalDocuments)
-    submission.subCategory3Accuracy = calculate_accuracy(submission.subCategory3Accuracy, totalDocuments)
-    submission.subCategory4Accuracy = calculate_accuracy(submission.subCategory4Accuracy, totalDocuments)    
+        # calculate scores
+        for future in concurrent.futures.as_completed(futures):
+            categorizedDocMap = future.result()
+            if categorizedDocMap is None:
+                continue
 
-    if not submission.single:        
-        submission.overallAccuracy = calculate_accuracy(submission.overallAccuracy, totalDocuments * 5)
-    else:
-        submission.overallAccuracy = submission.mainCategoryAccuracy        
+            for expectedDoc in expectedDocBatches[futures[future]]:
+                docId = expectedDoc.get('id')
+
+                categorizedDoc = categorizedDocMap.get(docId)
+                if categorizedDoc is not None:
+                    calculate_scores(submission, expectedDoc, categorizedDoc)
+    session.close()
+
+    # calculate actual accuracy
+    calculate_submission_accuracy(submission, totalDocuments)
     
     logger.info('The processing of the submission is completed successfully.')    
     
 
+def calculate_percentile(sortedValues, percentile):
+    '''
+    Calculate the percentile with the nearest rank method.
+    Args:
+        sortedValues: the sorted values
+        percentile: the percentile, from 0 to 100
+    Returns:
+        the percentile value, None if there are no values
+    '''
+    if not sortedValues:
+        return None
+    rank = int(math.ceil(percentile / 100.0 * len(sortedValues)))
+    return sortedValues[max(rank, 1) - 1]
+
+
+def send_load_request(session, endpoint, postedDocBatch, scheduledTime, requestTimeout):
+    '''
+    Send one request of the load test.
+    Args:
+        session: the session to send the request
+        endpoint: the submission api endpoint
+        postedDocBatch: a batch of documents to post
+        scheduledTime: the time the request is scheduled to send, the latency is measured from it
+        requestTimeout: the timeout to to receive response from submission's REST api endpoint
+    Returns:
+        the latency in seconds, the outcome (ok, error or timeout), and the number of posted documents
+    '''
+    try:
+        response = session.post(endpoint, json={ 'document': postedDocBatch }, timeout=requestTimeout)
+        outcome = 'ok' if response.status_code == requests.codes.ok else 'error'
+    except requests.exceptions.Timeout:
+        outcome = 'timeout'
+    except Exception:
+        outcome = 'error'
+    return time.time() - scheduledTime, outcome, len(postedDocBatch)
+
+
+def run_load_test(session, submission, postedDocs, batchSize, loadTest, requestTimeout, logger):
+    '''
+    Run the load test of one batch size against the submission api endpoint.
+    Args:
+        session: the session to send the requests
+        submission: the submission data
+        postedDocs: the documents to post, they are sent repeatedly
+        batchSize: the number of documents in each request
+        loadTest: the load test settings
+        requestTimeout: the timeout to to receive response from submission's REST api endpoint
+        logger: the logger
+    Returns:
+        the load test result
+    '''
+    logger.info('Start the load test of batch size %s against %s', batchSize, submission.endpoint)
+    batches = itertools.cycle([postedDocs[i:i + batchSize] for i in range(0, len(postedDocs), batchSize)])
+    batchesLock = threading.Lock()
+    outcomes = []
+
+    def next_batch():
+        with batchesLock:
+            return next(batches)
+
+    startTime = time.time()
+    deadline = startTime + loadTest.duration
+    with concurrent.futures.ThreadPoolExecutor(max_workers=loadTest.concurrency) as executor:
+        if loadTest.rate:
+            # open loop, the requests are scheduled at the target rate regardless of the responses
+            futures = []
+            requestNo = 0
+            while True:
+                scheduledTime = startTime + requestNo / loadTest.rate
+                if scheduledTime >= deadline:
+                    break
+                time.sleep(max(0, scheduledTime - time.time()))
+                futures.append(executor.submit(send_load_request, session, submission.endpoint, next_batch(), scheduledTime, requestTimeout))
+                requestNo += 1
+            outcomes = [future.result() for future in futures]
+        else:
+            # closed loop, each thread sends the next request as soon as the response is received
+            def send_until_deadline():
+                threadOutcomes = []
+                while time.time() < deadline:
+                    threadOutcomes.append(send_load_request(session, submission.endpoint, next_batch(), time.time(), requestTimeout))
+                return threadOutcomes
+
+            futures = [executor.submit(send_until_deadline) for _ in range(0, loadTest.concurrency)]
+            for future in futures:
+                outcomes.extend(future.result())
+    elapsed = time.time() - startTime
+
+    latencies = sorted(latency for latency, outcome, _ in outcomes if outcome == 'ok')
+    result = {
+        'requests': len(outcomes),
+        'errors': sum(1 for _, outcome, _ in outcomes if outcome == 'error'),
+        'timeouts': sum(1 for _, outcome, _ in outcomes if outcome == 'timeout'),
+        'requestsPerSecond': round(len(latencies) / elapsed, 2),
+        'documentsPerSecond': round(sum(count for _, outcome, count in outcomes if outcome == 'ok') / elapsed, 2)
+    }
+    for percentile in LOAD_TEST_PERCENTILES:
+        latency = calculate_percentile(latencies, percentile)
+        result['p%d' % percentile] = round(latency * 1000.0, 1) if latency is not None else None
+    logger.info('The load test of batch size %s against %s is completed: %s', batchSize, submission.endpoint, result)
+    return result
+
+
+def process_load_test(submission, postedDocs, loadTest, requestTimeout):
+    '''
+    Process the load test of the submission with each batch size.
+    Args:
+        submission: the submission data
+        postedDocs: the documents to post
+        loadTest: the load test settings
+        requestTimeout: the timeout to to receive response from submission's REST api endpoint
+    '''
+    logger = logging.getLogger('submission-' + submission.submissionId)
+    session = create_session(loadTest.concurrency)
+    submission.loadResults = {}
+    for batchSize in loadTest.batchSizes:
+        submission.loadResults[batchSize] = run_load_test(session, submission, postedDocs, batchSize, loadTest, requestTimeout, logger)
+    session.close()
+
+
 def main(argv):
     '''
     The entry point. It will parse the input data spreadsheet file and submission csv file, 
@@ -282,10 +467,22 @@ def main(argv):
     parser.add_argument('submissionsFile', help='The submissions csv file')
     parser.add_argument('--timeout', type=int, default=60, help='The timeout to receive response from submission''s REST api endpoint')
     parser.add_argument('--threads', type=int, default=5, help='The number of threads to process submissions')
+    parser.add_argument('--batch-size', type=int, default=10, help='The number of documents in each request')
+    parser.add_argument('--batch-concurrency', type=int, default=4, help='The number of requests in flight to each submission''s REST api endpoint')
+    parser.add_argument('--load-test', action='store_true', help='Load test each submission after the scores are calculated')
+    parser.add_argument('--load-batch-sizes', type=int, nargs='+', default=[1, 10, 100], help='The batch sizes of the load test')
+    parser.add_argument('--load-duration', type=float, default=30, help='The seconds to load test each batch size')
+    parser.add_argument('--load-concurrency', type=int, default=8, help='The max number of requests in flight of the load test')
+    parser.add_argument('--load-rate', type=float, help='The target requests per second of the load test, the requests are sent back to back by the concurrent threads if not given')
     args = parser.parse_args(argv)
 
     requestTimeout = args.timeout
     maxWorkers = args.threads
+    batchSize = args.batch_size
+    batchConcurrency = args.batch_concurrency
+    loadTest = None
+    if args.load_test:
+        loadTest = LoadTest(args.load_batch_sizes, args.load_duration, args.load_concurrency, args.load_rate)
 
     logger = logging.getLogger('main')
     
@@ -318,8 +515,6 @@ def main(argv):
     # read spreadsheet data
     logger.info('Load spreadsheet data.')
 
-    batchSize = 10
-
     # data to be posted to the submission api
     postedDocBatches = []
     postedDocs = []
@@ -356,6 +551,7 @@ def main(argv):
             'subcategory3': get_column_value(row, 5, rowLen),
             'subcategory4': get_column_value(row, 6, rowLen)
         }
+        expectedDoc['normalized'] = normalize_expected_doc(expectedDoc)
 
         postedDocs.append(postedDoc)
         expectedDocs.append(expectedDoc)
@@ -384,7 +580,7 @@ def main(argv):
     submissionCount = len(submissions)
     with concurrent.futures.ThreadPoolExecutor(max_workers=maxWorkers) as executor:
         for sub in submissions:
-            future = executor.submit(process_submission, sub, postedDocBatches, expectedDocBatches, totalDocuments, totalBatches, requestTimeout)
+            future = executor.submit(process_submission, sub, postedDocBatches, expectedDocBatches, totalDocuments, totalBatches, requestTimeout, batchConcurrency)
             futures.append(future)
 
         completed = 0
@@ -392,6 +588,11 @@ def main(argv):
             completed = completed + 1
             logger.info('%s of %s submission(s) have been processed.', completed, submissionCount)
 
+    # load test the submissions one by one, so they do not compete with each other
+    if loadTest:
+        postedDocs = [postedDoc for postedDocBatch in postedDocBatches for postedDoc in postedDocBatch]
+        for sub in submissions:
+            process_load_test(sub, postedDocs, loadTest, requestTimeout)
 
     # write result to csv file
     logger.info('Write the results to submission csv file')
@@ -401,6 +602,11 @@ def main(argv):
         'subcategory 1 accuracy', 'subcategory 2 accuracy', 'subcategory 3 accuracy',
         'subcategory 4 accuracy'
     ]
+    loadColumns = ['requests', 'errors', 'timeouts', 'requestsPerSecond', 'documentsPerSecond'] + ['p%d' % percentile for percentile in LOAD_TEST_PERCENTILES]
+    loadColumnNames = ['requests', 'errors', 'timeouts', 'requests/s', 'documents/s'] + ['p%d latency ms' % percentile for percentile in LOAD_TEST_PERCENTILES]
+    if loadTest:
+        for batchSize in loadTest.batchSizes:
+            csvHeader.extend(['batch %s %s' % (batchSize, name) for name in loadColumnNames])
     with open(args.submissionsFile, 'wb') as fd:
         csvWriter = csv.writer(fd)
 
@@ -414,6 +620,9 @@ def main(argv):
                 sub.mainCategoryAccuracy, sub.subCategory1Accuracy,sub.subCategory2Accuracy,
                 sub.subCategory3Accuracy, sub.subCategory4Accuracy
             ]
+            if loadTest:
+                for batchSize in loadTest.batchSizes:
+                    row.extend([sub.loadResults[batchSize][column] for column in loadColumns])
             csvWriter.writerow(row)
 
 